@@ -0,0 +1,119 @@
+"""
+Throughput of Knob.get() from many threads while another thread keeps resetting the environment,
+writing defaults back to os.environ on a miss against the read only mode. Then the cost of the
+registry lock: threads copying the registry sorted, as before the lock, the same copy under
+Knob._register_lock, and Knob._registered() walking the sorted name index, while another thread
+keeps registering knobs
+
+    $ python benchmarks/contention.py --threads 32
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from knobs import Knob  # noqa: E402
+
+KNOBS = 50
+
+
+def run(threads, seconds, write_default, cache):
+    Knob.clear_registry()
+    Knob.write_default = write_default
+    knobs = [Knob(f'BENCH_CONTENTION_{i}', i, cache=cache) for i in range(KNOBS)]
+    stop = threading.Event()
+    counts = [0] * threads
+
+    def reader(index):
+        count = 0
+        while not stop.is_set():
+            for knob in knobs:
+                knob.get()
+            count += len(knobs)
+        counts[index] = count
+
+    def resetter():
+        # something else mutating the environment, like a reload or a test harness
+        while not stop.is_set():
+            for knob in knobs:
+                os.environ.pop(knob.env_name, None)
+            time.sleep(0.001)
+
+    workers = [threading.Thread(target=reader, args=(i, )) for i in range(threads)]
+    workers.append(threading.Thread(target=resetter))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+def run_registry(threads, seconds, mode):
+    Knob.clear_registry()
+    for i in range(KNOBS):
+        Knob(f'BENCH_REGISTRY_{i}', i)
+    # workers spin once all are started, spinning walkers would starve the thread starting the others
+    go = threading.Event()
+    stop = threading.Event()
+    counts = [0] * threads
+    registrations = [0]
+
+    def walker(index):
+        go.wait()
+        count = 0
+        while not stop.is_set():
+            if mode == 'index':
+                Knob._registered()
+            elif mode == 'lock':
+                with Knob._register_lock:
+                    sorted(Knob._register.items())
+            else:
+                sorted(Knob._register.items())
+            count += 1
+        counts[index] = count
+
+    def registrar():
+        go.wait()
+        i = 0
+        while not stop.is_set():
+            Knob(f'BENCH_REGISTRY_{i % KNOBS}', i)
+            i += 1
+        registrations[0] = i
+
+    workers = [threading.Thread(target=walker, args=(i, )) for i in range(threads)]
+    workers.append(threading.Thread(target=registrar))
+    for worker in workers:
+        worker.start()
+    go.set()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds, registrations[0] / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f'{args.threads} threads, {KNOBS} knobs')
+    for write_default in (True, False):
+        for cache in (False, True):
+            throughput = run(args.threads, args.seconds, write_default, cache)
+            print(f'write_default={write_default!s:<6} cache={cache!s:<6}{throughput:>14,.0f} get/s')
+
+    print(f'{args.threads} threads walking a registry of {KNOBS} knobs, one thread registering')
+    for mode, label in (('bare', 'bare dict'), ('lock', 'bare dict, locked'), ('index', 'Knob._registered()')):
+        walks, registrations = run_registry(args.threads, args.seconds, mode)
+        print(f'{label:<20}{walks:>14,.0f} walks/s{registrations:>12,.0f} registrations/s')
+
+
+if __name__ == '__main__':
+    main()
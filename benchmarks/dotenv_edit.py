@@ -0,0 +1,64 @@
+"""
+Cost of scripting many edits to a .env: one DotenvEditor commit against a set_key/unset_key call per edit
+
+    $ python benchmarks/dotenv_edit.py --edits 10000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from environment import DotenvEditor, set_key, unset_key  # noqa: E402
+
+START_KEYS = 1000
+
+
+def make_edits(count):
+    rnd = random.Random(0)
+    return [(rnd.random() < 0.8, f'KEY_{rnd.randrange(START_KEYS * 2)}', f'value {i}') for i in range(count)]
+
+
+def write_env(path):
+    with open(path, 'w') as f:
+        for i in range(START_KEYS):
+            f.write(f'# key {i}\nKEY_{i}="value {i}"\n')
+
+
+def with_functions(path, edits):
+    for is_set, key, value in edits:
+        if is_set:
+            set_key(path, key, value)
+        else:
+            unset_key(path, key)
+
+
+def with_editor(path, edits):
+    with DotenvEditor(path) as dotenv:
+        for is_set, key, value in edits:
+            if is_set:
+                dotenv.set(key, value)
+            else:
+                dotenv.unset(key)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--edits', type=int, default=10000)
+    args = parser.parse_args()
+
+    edits = make_edits(args.edits)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, '.env')
+        for name, fn in (('set_key/unset_key', with_functions), ('DotenvEditor', with_editor)):
+            write_env(path)
+            start = time.perf_counter()
+            fn(path, edits)
+            print(f'{name:<20}{args.edits} edits {time.perf_counter() - start:>10.3f} s')
+
+
+if __name__ == '__main__':
+    main()
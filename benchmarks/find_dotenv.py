@@ -0,0 +1,50 @@
+"""
+Cost of looking up .env, .env.local and .env.production at varying directory depths:
+three find_dotenv calls against one find_dotenvs walk, revalidated and trusted from cache.
+
+    $ python benchmarks/find_dotenv.py
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from environment import clear_find_dotenvs_cache, find_dotenv, find_dotenvs  # noqa: E402
+
+FILENAMES = ('.env.production', '.env.local', '.env')
+NUMBER = 2000
+
+
+def main():
+    start_dir = os.getcwd()
+    print(f'{"depth":<8}{"find_dotenv x3 us":>20}{"uncached us":>16}{"revalidated us":>18}{"max_age us":>14}')
+    for depth in (2, 8, 32):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cwd = os.path.join(tmp_dir, *[f'level{i}' for i in range(depth)])
+            os.makedirs(cwd)
+            open(os.path.join(tmp_dir, '.env'), 'w').close()
+            os.chdir(cwd)
+
+            def legacy():
+                return [find_dotenv(filename, usecwd=True) for filename in FILENAMES]
+
+            def uncached():
+                clear_find_dotenvs_cache()
+                return find_dotenvs(FILENAMES, usecwd=True)
+
+            results = [
+                timeit.timeit(fn, number=NUMBER) / NUMBER * 1e6 for fn in (
+                    legacy,
+                    uncached,
+                    lambda: find_dotenvs(FILENAMES, usecwd=True),
+                    lambda: find_dotenvs(FILENAMES, usecwd=True, max_age=60),
+                )
+            ]
+            os.chdir(start_dir)
+        print(f'{depth:<8}{results[0]:>20.1f}{results[1]:>16.1f}{results[2]:>18.1f}{results[3]:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
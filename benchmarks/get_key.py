@@ -0,0 +1,65 @@
+"""
+Cost of get_key on large .env files: parsing the file on every call, the parse cache and the key index
+
+    $ python benchmarks/get_key.py
+"""
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from environment import DotenvIndex, dotenv_cache, dotenv_values, get_key  # noqa: E402
+
+NUMBER = 200
+
+
+def per_call(fn, number=NUMBER):
+    return timeit.timeit(fn, number=number) / number * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for lines in (10000, 100000):
+            path = os.path.join(tmp_dir, f'{lines}.env')
+            with open(path, 'w') as f:
+                for i in range(lines):
+                    f.write(f'KEY_{i}="value {i}"\n')
+                f.write('URL=http://${KEY_1}/\n')
+
+            def parsed():
+                dotenv_cache.invalidate(path)
+                return dotenv_values(path)['URL']
+
+            dotenv_values(path)
+            cached = per_call(lambda: dotenv_cache.values(path)['URL'])
+            parsed = per_call(parsed, 20)
+
+            index = DotenvIndex()
+            start = time.perf_counter()
+            index.get(path, 'URL')
+            indexing = (time.perf_counter() - start) * 1e6
+            indexed = per_call(lambda: index.get(path, 'URL'))
+
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            DotenvIndex(cache_dir=cache_dir).get(path, 'URL')
+            persisted = per_call(lambda: DotenvIndex(cache_dir=cache_dir).get(path, 'URL'), 20)
+
+            # get_key itself, the file is not held by the parse cache
+            dotenv_cache.invalidate(path)
+            get_key(path, 'URL')
+            get_key_us = per_call(lambda: get_key(path, 'URL'))
+
+            print(f'{lines} lines, key with a reference, us/call')
+            print(f'  full parse and resolve     {parsed:>10.0f}')
+            print(f'  parse cache hit            {cached:>10.1f}')
+            print(f'  first indexed lookup       {indexing:>10.0f}')
+            print(f'  indexed lookup             {indexed:>10.1f}')
+            print(f'  persisted index, new proc  {persisted:>10.0f}')
+            print(f'  get_key                    {get_key_us:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Cold start time of `import knobs` in a fresh interpreter, run from a directory holding a large .env
+
+    $ python benchmarks/import_time.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+RUNS = 20
+ENV_LINES = 10000
+
+
+def time_import(cwd, statement='import knobs'):
+    code = f'import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)'
+    env = dict(os.environ, PYTHONPATH=SRC)
+    out = subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, stdout=subprocess.PIPE, check=True).stdout
+    return float(out)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cwd = os.path.join(tmp_dir, *[f'level{i}' for i in range(8)])
+        os.makedirs(cwd)
+        with open(os.path.join(tmp_dir, '.env'), 'w') as f:
+            for i in range(ENV_LINES):
+                if i % 10 == 1:
+                    f.write(f'BENCH_IMPORT_KEY_{i}="${{BENCH_IMPORT_KEY_{i - 1}}}/{i}"\n')
+                else:
+                    f.write(f'BENCH_IMPORT_KEY_{i}="value {i}"\n')
+
+        for statement in ('import knobs', 'import knobs; knobs.Knob("BENCH", 1).get()'):
+            timings = [time_import(cwd, statement) for _ in range(RUNS)]
+            print(f'{statement:<50}{statistics.median(timings) * 1000:>10.1f} ms (median of {RUNS})')
+
+        # parsing and resolving without loading into os.environ, whose putenv calls dominate above,
+        # the first run with KNOBS_CACHE_DIR fills the on-disk cache
+        statement = 'import environment; environment.dotenv_values(environment.find_dotenv(usecwd=True))'
+        for label, cache_dir in (('dotenv_values', None), ('dotenv_values, KNOBS_CACHE_DIR', 'cache')):
+            if cache_dir:
+                os.environ['KNOBS_CACHE_DIR'] = os.path.join(tmp_dir, cache_dir)
+                time_import(cwd, statement)
+            timings = [time_import(cwd, statement) for _ in range(RUNS)]
+            os.environ.pop('KNOBS_CACHE_DIR', None)
+            print(f'{label:<50}{statistics.median(timings) * 1000:>10.1f} ms (median of {RUNS})')
+
+
+if __name__ == '__main__':
+    main()
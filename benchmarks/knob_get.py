@@ -0,0 +1,37 @@
+"""
+Per call cost of Knob.get() with and without the value cache.
+
+    $ python benchmarks/knob_get.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from knobs import Knob  # noqa: E402
+
+NUMBER = 200000
+
+
+def main():
+    cases = [
+        ('int', 124, '42'),
+        ('bool', True, 'yes'),
+        ('str', 'BAR', 'FOO'),
+        ('tuple', ('A', 'B'), 'DEAD BEEF COFFEE'),
+        ('validated', 10, '20'),
+    ]
+    print(f'{"case":<12}{"uncached ns/call":>20}{"cached ns/call":>20}')
+    for name, default, raw in cases:
+        validator = (lambda v: max(0, min(v, 100))) if name == 'validated' else None
+        env_name = f'BENCH_KNOB_{name.upper()}'
+        os.environ[env_name] = raw
+        uncached = Knob(env_name, default, validator=validator)
+        cached = Knob(env_name, default, validator=validator, cache=True)
+        results = [timeit.timeit(knob.get, number=NUMBER) / NUMBER * 1e9 for knob in (uncached, cached)]
+        print(f'{name:<12}{results[0]:>20.0f}{results[1]:>20.0f}')
+
+
+if __name__ == '__main__':
+    main()
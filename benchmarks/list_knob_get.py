@@ -0,0 +1,30 @@
+"""
+Per call cost of ListKnob.get() on large json lists with and without the decoded value cache.
+
+    $ python benchmarks/list_knob_get.py
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from knobs import ListKnob  # noqa: E402
+
+NUMBER = 2000
+
+
+def main():
+    print(f'{"items":<12}{"uncached us/call":>20}{"cached us/call":>20}')
+    for size in (10, 1000, 10000):
+        env_name = f'BENCH_LIST_KNOB_{size}'
+        os.environ[env_name] = json.dumps([f'shard{i}.example.com:{6000 + i}' for i in range(size)])
+        uncached = ListKnob(env_name, [])
+        cached = ListKnob(env_name, [], cache=True)
+        results = [timeit.timeit(knob.get, number=NUMBER) / NUMBER * 1e6 for knob in (uncached, cached)]
+        print(f'{size:<12}{results[0]:>20.1f}{results[1]:>20.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Resident bytes per registered knob, measured with tracemalloc
+
+    $ python benchmarks/memory.py
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from knobs import Knob, ListKnob  # noqa: E402
+
+KNOBS = 50000
+
+
+def bytes_per_knob(knob_class, default, description):
+    Knob.clear_registry()
+    # names are built before tracing, the application holds them anyway
+    names = [f'TENANT_{i // 100}_FEATURE_{i % 100}' for i in range(KNOBS)]
+    descriptions = [description.format(name=name) for name in names]
+    tracemalloc.start()
+    for name, description in zip(names, descriptions):
+        knob_class(name, default, description=description)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    Knob.clear_registry()
+    return size / KNOBS
+
+
+def main():
+    cases = [
+        ('Knob int', Knob, 124, ''),
+        ('Knob str, described', Knob, 'BAR', 'Per tenant feature flag'),
+        ('Knob str, own description', Knob, 'BAR', 'Feature flag {name}'),
+        ('ListKnob', ListKnob, ['a', 'b'], ''),
+    ]
+    print(f'{"case":<24}{"bytes/knob":>12}')
+    for name, knob_class, default, description in cases:
+        print(f'{name:<24}{bytes_per_knob(knob_class, default, description):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
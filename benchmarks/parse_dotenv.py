@@ -0,0 +1,60 @@
+"""
+Throughput of parse_dotenv against the previous line by line parser on 1k and 100k line files
+
+    $ python benchmarks/parse_dotenv.py
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from environment import decode_escaped, parse_dotenv  # noqa: E402
+
+
+def line_parser(dotenv_path):
+    """ parse_dotenv as it was before the single pass tokenizer """
+    with open(dotenv_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            k, v = line.split('=', 1)
+            k, v = k.strip(), v.strip()
+            if len(v) > 0:
+                quoted = v[0] == v[len(v) - 1] in ['"', "'"]
+                if quoted:
+                    v = decode_escaped(v[1:-1])
+            yield k, v
+
+
+def write_env(path, lines):
+    with open(path, 'w') as f:
+        for i in range(lines):
+            if i % 10 == 0:
+                f.write(f'# section {i}\n')
+            elif i % 3 == 0:
+                f.write(f'KEY_{i}="quoted value {i}"\n')
+            elif i % 7 == 0:
+                f.write(f'KEY_{i}="escaped\\tvalue\\n{i}"\n')
+            else:
+                f.write(f'KEY_{i}=plain_value_{i}\n')
+
+
+def main():
+    print(f'{"lines":<10}{"line parser ms":>18}{"tokenizer ms":>16}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for lines, number in ((1000, 200), (100000, 3)):
+            path = os.path.join(tmp_dir, f'{lines}.env')
+            write_env(path, lines)
+            assert list(line_parser(path)) == list(parse_dotenv(path))
+            results = [
+                timeit.timeit(lambda: list(parser(path)), number=number) / number * 1000
+                for parser in (line_parser, parse_dotenv)
+            ]
+            print(f'{lines:<10}{results[0]:>18.2f}{results[1]:>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Startup of a spawn process pool of 64 workers that read a knob, run from a directory holding a large .env.
+Workers load the .env themselves, or get the parent's values from knobs.pool_initializer()
+
+    $ python benchmarks/pool_startup.py
+"""
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import knobs  # noqa: E402
+from knobs import Knob  # noqa: E402
+
+WORKERS = 64
+RUNS = 3
+ENV_LINES = 10000
+
+
+def read_knob():
+    Knob('BENCH_POOL_KNOB', 1).get()
+
+
+def install_and_read_knob(exported):
+    knobs.install_knobs(exported)
+    read_knob()
+
+
+def start_pool(initializer, initargs=()):
+    start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(WORKERS, initializer, initargs) as pool:
+        # one task per worker, the pool is up once every initializer ran
+        pool.map(time.sleep, [0.001] * WORKERS, chunksize=1)
+    return time.perf_counter() - start
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, '.env'), 'w') as f:
+            for i in range(ENV_LINES):
+                f.write(f'BENCH_POOL_KEY_{i}="value {i}"\n')
+        os.chdir(tmp_dir)
+        os.environ['BENCH_POOL_KNOB'] = '2'
+        # the parent loaded .env like any application, spawned workers inherit its environment
+        read_knob()
+
+        cases = [
+            ('workers load .env', lambda: start_pool(read_knob)),
+            ('pool_initializer()', lambda: start_pool(install_and_read_knob, knobs.pool_initializer()[1])),
+        ]
+        for name, run in cases:
+            timings = [run() for _ in range(RUNS)]
+            print(f'{name:<24}{statistics.median(timings) * 1000:>10.0f} ms (median of {RUNS}, {WORKERS} workers)')
+
+
+if __name__ == '__main__':
+    main()
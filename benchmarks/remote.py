@@ -0,0 +1,58 @@
+"""
+Rendering the current values of knobs held by a config service with 1ms latency: a request per knob
+against batched fetches of all registered knobs, and renders served from the ttl cache
+
+    $ python benchmarks/remote.py
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import knobs  # noqa: E402
+from knobs import Knob  # noqa: E402
+from remote import HttpBackend, LocalConfigServer, RemoteSource  # noqa: E402
+
+KNOBS = 2000
+LATENCY = 0.001
+
+
+class PerKnobSource:
+    """ What a client without batching does, a request per lookup """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, name):
+        return self.backend.fetch([name]).get(name)
+
+
+def render():
+    start = time.perf_counter()
+    Knob.write_knobs(io.StringIO(), 'jsonl', current=True)
+    return (time.perf_counter() - start) * 1e3
+
+
+def main():
+    values = {f'BENCH_REMOTE_{i}': str(i) for i in range(KNOBS)}
+    for name in values:
+        Knob(name, 0)
+
+    with LocalConfigServer(values, latency=LATENCY) as server:
+        print(f'{KNOBS} knobs, {LATENCY * 1e3:.0f}ms latency, ms/render')
+
+        knobs.use_sources(PerKnobSource(HttpBackend(server.url)))
+        print(f'  request per knob           {render():>10.1f}  {len(server.requests)} requests')
+
+        for batch_size in (KNOBS, 250):
+            del server.requests[:]
+            knobs.use_sources(RemoteSource(HttpBackend(server.url), batch_size=batch_size))
+            cold = render()
+            print(f'  batches of {batch_size:<5}  cold     {cold:>10.1f}  {len(server.requests)} requests')
+        print(f'  ttl cache hit              {render():>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
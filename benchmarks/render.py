@@ -0,0 +1,57 @@
+"""
+Time and peak memory of rendering a large registry, tabulate tables against the streaming writer
+
+    $ python benchmarks/render.py --knobs 20000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from knobs import Knob  # noqa: E402
+
+
+class NullFile(io.TextIOBase):
+    """ Discards what is written, like a pipe to /dev/null """
+
+    def write(self, text):
+        return len(text)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--knobs', type=int, default=20000)
+    args = parser.parse_args()
+
+    Knob.write_default = False
+    for i in range(args.knobs):
+        Knob(f'TENANT_{i % 100}_FEATURE_{i}', i, description=f'Feature {i} of tenant {i % 100}')
+
+    cases = [
+        ('tabulate defaults', Knob.get_knob_defaults_as_table),
+        ('tabulate current', Knob.get_knobs_current_as_table),
+    ] + [(f'stream {fmt}', lambda fmt=fmt: Knob.write_knobs(NullFile(), fmt, current=True))
+         for fmt in ('table', 'jsonl', 'csv', 'dotenv')]
+
+    print(f'{args.knobs} knobs')
+    for name, fn in cases:
+        elapsed, peak = measure(fn)
+        print(f'{name:<20}{elapsed:>10.3f} s{peak / 2 ** 20:>10.1f} MiB peak')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""
+Benchmark suite with machine readable results that can be compared across commits
+
+    $ python benchmarks/suite.py -o before.json
+    $ git checkout my-branch
+    $ python benchmarks/suite.py -o after.json
+    $ python benchmarks/suite.py --compare before.json after.json
+
+Every benchmark reports seconds per operation, the best and the median of a few repeats.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from fnmatch import fnmatchcase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir, 'src'))
+
+import environment  # noqa: E402
+from import_time import time_import  # noqa: E402
+from knobs import Knob, ListKnob  # noqa: E402
+from parse_dotenv import write_env  # noqa: E402
+
+REPEAT = 5
+MIN_TIME = 0.1
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """ Register a benchmark, the decorated function returns (seconds per op of each repeat) """
+
+    def register(fn):
+        BENCHMARKS.append((name, fn))
+        return fn
+
+    return register
+
+
+def time_per_op(fn, setup=None, repeat=REPEAT):
+    """
+    :param fn: operation to time
+    :param setup: called untimed before every op, each repeat then times a single op
+    :return: list of seconds per op
+    """
+    timer = timeit.Timer(fn)
+    if setup is not None:
+        timings = []
+        for _ in range(repeat):
+            setup()
+            timings.append(timer.timeit(1))
+        return timings
+
+    number = 1
+    while True:
+        if timer.timeit(number) >= MIN_TIME or number >= 1 << 20:
+            break
+        number *= 4
+    timings = []
+    for _ in range(repeat):
+        timings.append(timer.timeit(number) / number)
+    return timings
+
+
+# Knob.get per cast type
+
+KNOB_CASES = {
+    'int': (124, '42'),
+    'float': (1.5, '2.5'),
+    'bool': (True, 'yes'),
+    'str': ('BAR', 'FOO'),
+    'tuple': (('A', 'B'), 'DEAD BEEF COFFEE'),
+    'list': (['A', 'B'], 'DEAD BEEF COFFEE'),
+}
+
+for _kind, (_default, _raw) in KNOB_CASES.items():
+    for _cache in (False, True):
+
+        @benchmark(f'knob.get.{_kind}.{"cached" if _cache else "uncached"}')
+        def _knob_get(kind=_kind, default=_default, raw=_raw, cache=_cache):
+            env_name = f'BENCH_SUITE_{kind.upper()}'
+            os.environ[env_name] = raw
+            return time_per_op(Knob(env_name, default, cache=cache).get)
+
+
+@benchmark('knob.get.unset_default')
+def _knob_get_default():
+    knob = Knob('BENCH_SUITE_UNSET', 124, write_default=False)
+    os.environ.pop('BENCH_SUITE_UNSET', None)
+    return time_per_op(knob.get)
+
+
+for _items in (10, 1000):
+    for _cache in (False, True):
+
+        @benchmark(f'list_knob.get.{_items}.{"cached" if _cache else "uncached"}')
+        def _list_knob_get(items=_items, cache=_cache):
+            env_name = f'BENCH_SUITE_LIST_{items}'
+            os.environ[env_name] = json.dumps([f'shard{i}.example.com:{6000 + i}' for i in range(items)])
+            return time_per_op(ListKnob(env_name, [], cache=cache).get)
+
+
+@benchmark('knob.snapshot.1000')
+def _snapshot():
+    Knob.clear_registry()
+    for i in range(1000):
+        os.environ[f'BENCH_SUITE_SNAPSHOT_{i}'] = str(i)
+        Knob(f'BENCH_SUITE_SNAPSHOT_{i}', 0)
+    timings = time_per_op(Knob.snapshot)
+    Knob.clear_registry()
+    return timings
+
+
+@benchmark('knob.by_prefix.20000')
+def _by_prefix():
+    Knob.clear_registry()
+    for i in range(20000):
+        Knob(f'TENANT_{i // 100}_FEATURE_{i % 100}', i)
+    timings = time_per_op(lambda: Knob.by_prefix('TENANT_42_'))
+    Knob.clear_registry()
+    return timings
+
+
+# dotenv parsing and interpolation
+
+
+def _write_interpolated_env(path, lines, reference_percent):
+    with open(path, 'w') as f:
+        for i in range(lines):
+            if i and i % 100 < reference_percent:
+                f.write(f'KEY_{i}="${{KEY_{i - 1}}}/{i}"\n')
+            else:
+                f.write(f'KEY_{i}="value {i}"\n')
+
+
+for _lines in (1000, 10000, 100000):
+
+    @benchmark(f'parse_dotenv.{_lines}')
+    def _parse_dotenv(lines=_lines):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, '.env')
+            write_env(path, lines)
+            return time_per_op(lambda: list(environment.parse_dotenv(path)))
+
+
+for _lines in (1000, 10000):
+    for _percent in (0, 10, 50):
+
+        @benchmark(f'dotenv_values.{_lines}.refs_{_percent}pct')
+        def _dotenv_values(lines=_lines, percent=_percent):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, '.env')
+                _write_interpolated_env(path, lines, percent)
+
+                def uncached():
+                    environment.dotenv_cache.invalidate(path)
+                    return environment.dotenv_values(path)
+
+                return time_per_op(uncached)
+
+
+@benchmark('dotenv_values.10000.cached')
+def _dotenv_values_cached():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, '.env')
+        _write_interpolated_env(path, 10000, 10)
+        return time_per_op(lambda: environment.dotenv_values(path))
+
+
+# find_dotenv
+
+
+def _in_deep_directory(depth, fn):
+    start_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cwd = os.path.join(tmp_dir, *[f'level{i}' for i in range(depth)])
+        os.makedirs(cwd)
+        open(os.path.join(tmp_dir, '.env'), 'w').close()
+        os.chdir(cwd)
+        try:
+            return fn()
+        finally:
+            os.chdir(start_dir)
+
+
+for _depth in (2, 8, 32):
+
+    @benchmark(f'find_dotenv.depth_{_depth}')
+    def _find_dotenv(depth=_depth):
+        return _in_deep_directory(depth, lambda: time_per_op(lambda: environment.find_dotenv(usecwd=True)))
+
+    @benchmark(f'find_dotenvs.depth_{_depth}.revalidated')
+    def _find_dotenvs(depth=_depth):
+        filenames = ('.env.local', '.env')
+        return _in_deep_directory(depth, lambda: time_per_op(lambda: environment.find_dotenvs(filenames, usecwd=True)))
+
+
+# bulk edits
+
+
+def _bulk_edit_setup(path):
+    with open(path, 'w') as f:
+        for i in range(1000):
+            f.write(f'KEY_{i}="value {i}"\n')
+
+
+@benchmark('set_key.bulk_100')
+def _set_key_bulk():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, '.env')
+
+        def edits():
+            for i in range(100):
+                environment.set_key(path, f'KEY_{i * 7}', f'edited {i}')
+
+        return time_per_op(edits, setup=lambda: _bulk_edit_setup(path), repeat=3)
+
+
+@benchmark('dotenv_editor.bulk_100')
+def _dotenv_editor_bulk():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, '.env')
+
+        def edits():
+            with environment.DotenvEditor(path) as dotenv:
+                for i in range(100):
+                    dotenv.set(f'KEY_{i * 7}', f'edited {i}')
+
+        return time_per_op(edits, setup=lambda: _bulk_edit_setup(path))
+
+
+# cold start
+
+
+@benchmark('import.cold_start')
+def _import_cold_start():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return [time_import(tmp_dir) for _ in range(10)]
+
+
+def run(pattern):
+    results = {}
+    for name, fn in BENCHMARKS:
+        if pattern and not fnmatchcase(name, pattern):
+            continue
+        try:
+            timings = fn()
+        except (ImportError, AttributeError) as e:
+            # an older tree without the feature, the run goes on and the benchmark is compared as skipped
+            results[name] = {'skipped': f'{type(e).__name__}: {e}'}
+            print(f'{name:<45}{"skipped":>17}  {results[name]["skipped"]}', file=sys.stderr)
+            continue
+        results[name] = {'best': min(timings), 'median': statistics.median(timings), 'repeat': len(timings)}
+        print(f'{name:<45}{results[name]["best"] * 1e6:>14.2f} us', file=sys.stderr)
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def compare(before_path, after_path, threshold):
+    """
+    Print the ratio of the best timings of two result files, benchmarks skipped on either side have none
+    :return: names of the benchmarks that got slower than threshold
+    """
+    with open(before_path) as f:
+        before = json.load(f)['results']
+    with open(after_path) as f:
+        after = json.load(f)['results']
+
+    regressions = []
+    print(f'{"benchmark":<45}{"before us":>14}{"after us":>14}{"ratio":>9}')
+    for name in sorted(before.keys() & after.keys()):
+        if 'skipped' in before[name] or 'skipped' in after[name]:
+            old = f'{before[name]["best"] * 1e6:.2f}' if 'best' in before[name] else 'skipped'
+            new = f'{after[name]["best"] * 1e6:.2f}' if 'best' in after[name] else 'skipped'
+            print(f'{name:<45}{old:>14}{new:>14}')
+            continue
+        old, new = before[name]['best'], after[name]['best']
+        ratio = new / old
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  slower'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print(f'{name:<45}{old * 1e6:>14.2f}{new * 1e6:>14.2f}{ratio:>9.2f}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='write results as json to this file, default stdout')
+    parser.add_argument('-k', '--pattern', help='only run benchmarks matching this shell style pattern')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1, help='relative change reported as slower or faster, default 0.1'
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    os.environ['KNOBS_NO_AUTOLOAD'] = '1'
+    report = {'meta': metadata(), 'results': run(args.pattern)}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
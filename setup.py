@@ -38,6 +38,9 @@ setup(
         'Topic :: Utilities',
     ],
     keywords=[],
+    entry_points={
+        'console_scripts': ['knobs-diff=knobs_diff:main'],
+    },
     extras_require={},
     setup_requires=[],
 )
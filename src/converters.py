@@ -0,0 +1,237 @@
+"""
+Converters cast environment strings to the type of a knob. A converter is picked once per knob,
+from the type of its default or an explicit kind, by a factory registered for that kind.
+
+    >>> @register_converter('csv')
+    ... def csv_converter(cast):
+    ...     return lambda value: [item.strip() for item in value.split(',')]
+    >>> get_converter('csv', list)('a, b')
+    ['a', 'b']
+
+Converters raise ValueError on strings they can't cast.
+"""
+import datetime
+import decimal
+import enum
+import json
+import pathlib
+import re
+
+BOOLEAN_TRUE_STRINGS = ('true', 'on', 'ok', 'y', 'yes', '1')
+
+# kind, a type or a name, -> factory taking the knob's type and returning the converter
+_factories = {}
+# kind name -> type of the values its converters return
+_returns = {}
+
+
+def register_converter(*kinds, returns=None):
+    """
+    Decorator registering a converter factory for kinds. Types match their subclasses too.
+    :param kinds: types or kind names
+    :param returns: type the converters of the named kinds return, defaults to the first type in kinds.
+                    Without one a knob's type is the type of its default
+    :return: decorator
+    """
+    if returns is None:
+        returns = next((kind for kind in kinds if isinstance(kind, type)), None)
+
+    def register(factory):
+        for kind in kinds:
+            _factories[kind] = factory
+            if returns is not None and isinstance(kind, str):
+                _returns[kind] = returns
+        return factory
+
+    return register
+
+
+def get_converter(kind, cast):
+    """
+    :param kind: type or kind name
+    :param cast: type of the knob's default
+    :return: function casting an environment string, kind itself when it's a callable with no converter registered
+    """
+    factory = _factories.get(kind)
+    if factory is None and isinstance(kind, type):
+        # enums first, an IntEnum would otherwise be cast as an int
+        if issubclass(kind, enum.Enum):
+            factory = _factories.get(enum.Enum)
+        else:
+            factory = next((_factories[base] for base in kind.__mro__ if base in _factories), None)
+    if factory is None:
+        if not callable(kind):
+            raise ValueError(f"Unknown converter kind '{kind}'")
+        return kind
+    return factory(kind if isinstance(kind, type) else cast)
+
+
+def converter_type(kind, cast):
+    """
+    :param kind: type or kind name
+    :param cast: type of the knob's default
+    :return: type of the values the converter of kind returns
+    """
+    if isinstance(kind, type):
+        return kind
+    returns = _returns.get(kind)
+    if returns is None or issubclass(cast, returns):
+        return cast
+    return returns
+
+
+@register_converter(bool, 'bool')
+def bool_converter(cast):
+    return lambda value: value.lower() in BOOLEAN_TRUE_STRINGS
+
+
+@register_converter(list, 'list')
+def list_converter(cast):
+    return str.split
+
+
+@register_converter(tuple, 'tuple')
+def tuple_converter(cast):
+    return lambda value: tuple(value.split())
+
+
+@register_converter('json')
+def json_converter(cast):
+    return json.loads
+
+
+@register_converter(float, 'float')
+def float_converter(cast):
+    return float
+
+
+@register_converter(pathlib.PurePath, 'path', returns=pathlib.Path)
+def path_converter(cast):
+    if not issubclass(cast, pathlib.PurePath):
+        cast = pathlib.Path
+    return lambda value: cast(value).expanduser()
+
+
+@register_converter(decimal.Decimal, 'decimal')
+def decimal_converter(cast):
+
+    def convert(value):
+        try:
+            return decimal.Decimal(value)
+        except decimal.InvalidOperation:
+            raise ValueError(f"Invalid decimal '{value}'") from None
+
+    return convert
+
+
+@register_converter(enum.Enum)
+def enum_converter(cast):
+    # by name, by value and by str(member), which is what Knob.set() writes
+    members = {}
+    for name, member in cast.__members__.items():
+        members[str(member.value)] = member
+        members[str(member)] = member
+        members[name] = member
+    choices = ', '.join(cast.__members__)
+
+    def convert(value):
+        try:
+            return members[value]
+        except KeyError:
+            raise ValueError(f"'{value}' is not one of {choices}") from None
+
+    return convert
+
+
+DURATION_UNITS = {
+    'us': 1e-6,
+    'ms': 1e-3,
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400,
+    'w': 604800,
+}
+_number = re.compile(r'-?(?:\d+(?:\.\d*)?|\.\d+)')
+_duration_part = re.compile(r'\s*(\d+(?:\.\d*)?|\.\d+)\s*(us|ms|s|m|h|d|w)', re.IGNORECASE)
+# str(timedelta), '1 day, 2:03:04.500000'
+_timedelta_str = re.compile(r'(?:(-?\d+) days?, )?(\d+):(\d\d):(\d\d(?:\.\d+)?)')
+
+
+def parse_duration(value):
+    """
+    Parse a duration like '1h30m', '250ms', '1.5s' or '1 day, 0:00:05', plain numbers are seconds
+    >>> parse_duration('1m30s')
+    datetime.timedelta(seconds=90)
+
+    :param value: duration string
+    :return: timedelta
+    """
+    value = value.strip()
+    if _number.fullmatch(value):
+        return datetime.timedelta(seconds=float(value))
+
+    match = _timedelta_str.fullmatch(value)
+    if match:
+        days, hours, minutes, seconds = match.groups()
+        return datetime.timedelta(
+            days=int(days or 0), hours=int(hours), minutes=int(minutes), seconds=float(seconds)
+        )
+
+    sign = -1 if value.startswith('-') else 1
+    rest = value.lstrip('-')
+    seconds = 0.0
+    position = 0
+    for match in _duration_part.finditer(rest):
+        if match.start() != position:
+            break
+        seconds += float(match.group(1)) * DURATION_UNITS[match.group(2).lower()]
+        position = match.end()
+    if not position or rest[position:].strip():
+        raise ValueError(f"Invalid duration '{value}'")
+    return datetime.timedelta(seconds=sign * seconds)
+
+
+@register_converter(datetime.timedelta, 'duration')
+def duration_converter(cast):
+    return parse_duration
+
+
+SIZE_UNITS = {
+    '': 1,
+    'k': 10**3,
+    'm': 10**6,
+    'g': 10**9,
+    't': 10**12,
+    'p': 10**15,
+    'ki': 2**10,
+    'mi': 2**20,
+    'gi': 2**30,
+    'ti': 2**40,
+    'pi': 2**50,
+}
+_size = re.compile(r'\s*(\d+(?:\.\d*)?|\.\d+)\s*([kmgtp]i?)?b?\s*', re.IGNORECASE)
+
+
+def parse_size(value):
+    """
+    Parse a byte size like '512', '10MB', '1.5GiB' or '64k', K is 1000 and Ki 1024
+    >>> parse_size('2KiB')
+    2048
+
+    :param value: size string
+    :return: int bytes
+    """
+    match = _size.fullmatch(value)
+    if not match:
+        raise ValueError(f"Invalid size '{value}'")
+    number, unit = match.groups()
+    multiplier = SIZE_UNITS[(unit or '').lower()]
+    if number.isdigit():
+        return int(number) * multiplier
+    return int(float(number) * multiplier)
+
+
+@register_converter('size', returns=int)
+def size_converter(cast):
+    return parse_size
@@ -2,15 +2,47 @@
 # https://github.com/theskumar/python-dotenv
 # https://github.com/mattseymour/python-env
 
+import bisect
 import codecs
+import hashlib
+import io
+import json
 import os
 import re
+import shutil
+import stat
+import struct
 import sys
+import tempfile
+import threading
+import time
 import warnings
+import zlib
 from collections import OrderedDict
 
 __escape_decoder = codecs.getdecoder('unicode_escape')
-__posix_variable = re.compile(r'\$\{[^\}]*\}')
+__posix_variable = re.compile(r'\$\{([^\}:]*)(?::([-?])([^\}]*))?\}')
+__dotenv_entry = re.compile(
+    r'''
+    ^[ \t]*
+    (?:export[ \t]+)?
+    ([^\s=\#][^=\n]*)=[ \t]*
+    (?:
+        "([^"\\]*(?:\\[\s\S][^"\\]*)*)"[ \t]*(?:\#[^\n]*)?\r?$
+      | '([^'\\]*(?:\\[\s\S][^'\\]*)*)'[ \t]*(?:\#[^\n]*)?\r?$
+      | ([^\n]*)
+    )
+    ''', re.VERBOSE | re.MULTILINE
+)
+__inline_comment = re.compile(r'[ \t]+\#')
+
+# (start directory, filenames) -> (checked at, ((directory, mtime), ...), matches)
+_find_dotenvs_cache = {}
+
+# directory of the on-disk cache of parsed and resolved dotenv files, unset to disable
+CACHE_DIR_ENV = 'KNOBS_CACHE_DIR'
+# bumped when the layout of persisted entries changes
+_PERSIST_FORMAT = 4
 
 
 def decode_escaped(escaped):
@@ -30,7 +62,7 @@ def load_dotenv(dotenv_path, verbose=False):
         if verbose:
             warnings.warn(f"Not loading {dotenv_path}, it doesn't exist.")
         return None
-    for k, v in dotenv_values(dotenv_path).items():
+    for k, v in dotenv_cache.values(dotenv_path).items():
         os.environ.setdefault(k, v)
     return True
 
@@ -50,13 +82,15 @@ def get_key(dotenv_path, key_to_get, verbose=False):
         if verbose:
             warnings.warn(f"Can't read {dotenv_path}, it doesn't exist.")
         return None
-    dotenv_as_dict = dotenv_values(dotenv_path)
-    if key_to_get in dotenv_as_dict:
-        return dotenv_as_dict[key_to_get]
+    # a file parsed before is answered from memory, otherwise only the key and what it refers to are read
+    dotenv_as_dict = dotenv_cache.cached_values(dotenv_path)
+    if dotenv_as_dict is not None:
+        value = dotenv_as_dict.get(key_to_get)
     else:
-        if verbose:
-            warnings.warn(f"key {key_to_get} not found in {dotenv_path}.")
-        return None
+        value = dotenv_index.get(dotenv_path, key_to_get)
+    if value is None and verbose:
+        warnings.warn(f"key {key_to_get} not found in {dotenv_path}.")
+    return value
 
 
 def set_key(dotenv_path, key_to_set, value_to_set, quote_mode='always', verbose=False):
@@ -80,7 +114,7 @@ def set_key(dotenv_path, key_to_set, value_to_set, quote_mode='always', verbose=
             warnings.warn(f"Can't write to {dotenv_path}, it doesn't exist.")
         return None, key_to_set, value_to_set
 
-    dotenv_as_dict = OrderedDict(parse_dotenv(dotenv_path))
+    dotenv_as_dict = OrderedDict(dotenv_cache.raw(dotenv_path))
     dotenv_as_dict[key_to_set] = value_to_set
     success = flatten_and_write(dotenv_path, dotenv_as_dict, quote_mode)
 
@@ -122,62 +156,590 @@ def dotenv_values(dotenv_path):
     :param dotenv_path: env file
     :return: ordered dict
     """
-    values = OrderedDict(parse_dotenv(dotenv_path))
-    values = resolve_nested_variables(values)
-    return values
+    return OrderedDict(dotenv_cache.values(dotenv_path))
+
+
+class DotenvCache:
+    """
+    Process wide cache of parsed and resolved dotenv files. Entries are keyed on the path and
+    checked against the file's (mtime, size), and optionally a hash of its content, on every
+    lookup. Resolved values are also checked against the environment variables they refer to.
+    The least recently used file is evicted beyond maxsize.
+
+    With a cache_dir, parsed and resolved files are also kept on disk as json, keyed on the path,
+    mtime, size and a hash of the content, so short lived processes skip parsing and interpolating
+    an unchanged file. Unreadable, stale or corrupt entries fall back to a fresh parse, and so does
+    a cache_dir that others can write to.
+
+    Mappings handed out are shared, callers must copy before mutating.
+    """
+
+    def __init__(self, maxsize=64, content_hash=False, cache_dir=None):
+        """
+        :param maxsize: number of files kept
+        :param content_hash: also compare a hash of the content, catches rewrites within the mtime resolution
+        :param cache_dir: directory of the on-disk cache, None to keep entries in memory only
+        """
+        self.maxsize = maxsize
+        self.content_hash = content_hash
+        self.cache_dir = cache_dir
+        # path -> [signature, raw values, resolved values, ((referenced name, environ value), ...)]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def raw(self, dotenv_path):
+        """
+        :param dotenv_path: env file
+        :return: ordered dict of the values as written in the file
+        """
+        return self._entry(dotenv_path)[1]
+
+    def values(self, dotenv_path):
+        """
+        :param dotenv_path: env file
+        :return: ordered dict of the values with references resolved
+        """
+        entry = self._entry(dotenv_path)
+        _, raw, resolved, environ = entry
+        if resolved is not None and all(os.environ.get(name) == value for name, value in environ):
+            return resolved
+
+        resolved = resolve_nested_variables(OrderedDict(raw))
+        environ = tuple((name, os.environ.get(name)) for name in _referenced_names(raw))
+        with self._lock:
+            entry[2:] = resolved, environ
+        if self.cache_dir:
+            self._persist(os.path.abspath(dotenv_path), entry)
+        return resolved
+
+    def cached_values(self, dotenv_path):
+        """
+        :param dotenv_path: env file
+        :return: values() if the file is held in memory and unchanged, None instead of parsing it
+        """
+        path = os.path.abspath(dotenv_path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None or entry[0] != self._signature(path):
+            return None
+        return self.values(path)
+
+    def invalidate(self, dotenv_path=None):
+        """
+        Forget a file, or all files
+        :param dotenv_path: env file, None for all
+        """
+        with self._lock:
+            if dotenv_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(dotenv_path), None)
+
+    def _signature(self, dotenv_path):
+        st = os.stat(dotenv_path)
+        if not self.content_hash:
+            return st.st_mtime_ns, st.st_size
+        with open(dotenv_path, 'rb') as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16).digest()
+        return st.st_mtime_ns, st.st_size, digest
+
+    def _entry(self, dotenv_path):
+        path = os.path.abspath(dotenv_path)
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                return entry
+
+        entry = self._load_persisted(path, signature) if self.cache_dir else None
+        if entry is None:
+            entry = [signature, OrderedDict(parse_dotenv(path)), None, ()]
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _persisted_path(self, path):
+        name = hashlib.blake2b(os.fsencode(path), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f'{name}.dotenv-cache')
+
+    def _persist_key(self, path):
+        """ What a persisted entry of path must have been written for, None if path can't be read """
+        try:
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                digest = hashlib.blake2b(f.read(), digest_size=16).digest()
+        except OSError:
+            return None
+        return [_PERSIST_FORMAT, path, st.st_mtime_ns, st.st_size, digest.hex()]
+
+    def _load_persisted(self, path, signature):
+        """
+        :return: cache entry read from disk, None if there is no valid one
+        """
+        key = self._persist_key(path)
+        if key is None or not _trusted_cache_dir(self.cache_dir):
+            return None
+        try:
+            with open(self._persisted_path(path), 'rb') as f:
+                persisted_key, raw, resolved, environ = json.loads(f.read())
+            if persisted_key != key:
+                return None
+            # json objects keep their order
+            raw = OrderedDict(raw)
+            resolved = None if resolved is None else OrderedDict(resolved)
+            environ = tuple((name, value) for name, value in environ)
+        except Exception:
+            # whatever is in the file, a corrupt entry is a miss
+            return None
+        return [signature, raw, resolved, environ]
+
+    def _persist(self, path, entry):
+        """ Write an entry to disk atomically, the cache is best effort and errors are ignored """
+        key = self._persist_key(path)
+        if key is None or (key[2], key[3]) != entry[0][:2]:
+            # the file changed since it was parsed
+            return
+        _, raw, resolved, environ = entry
+        data = json.dumps([key, raw, resolved, environ]).encode('ascii')
+        _write_cache_file(self.cache_dir, self._persisted_path(path), data)
+
+
+dotenv_cache = DotenvCache(cache_dir=os.environ.get(CACHE_DIR_ENV) or None)
+
+
+class DotenvIndex:
+    """
+    Single key lookups in large dotenv files. One tokenizing pass, without interpolation, maps every
+    key to the byte span of its last assignment. A lookup then seeks to the entry and resolves only
+    the references of that key, transitively.
+
+    Indexes are checked against the file's (mtime, size, inode), an entry that no longer parses as
+    indexed has the index rebuilt. With a cache_dir an index is also written to disk as a hash table
+    of spans, which later processes probe in place, so their lookups cost a few small reads whatever
+    the size of the file.
+    """
+
+    def __init__(self, maxsize=16, cache_dir=None):
+        """
+        :param maxsize: number of indexed files kept in memory
+        :param cache_dir: directory of the on-disk indexes, None to keep them in memory only
+        """
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        # path -> _SpanIndex or _SpanTable
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, dotenv_path, key):
+        """
+        :param dotenv_path: env file
+        :param key: key
+        :return: resolved value, None if the file doesn't set key
+        :raises: InterpolationError as dotenv_values() would for the key
+        """
+        path = os.path.abspath(dotenv_path)
+        with open(path, 'rb') as f:
+            index = self._index(path, f)
+            raw = self._read_closure(f, index, key)
+            if raw is None:
+                # stale index, the file changed within the stat resolution
+                index = self._index(path, f, rebuild=True)
+                raw = self._read_closure(f, index, key)
+        if raw is None or key not in raw:
+            return None
+        return resolve_nested_variables(raw)[key]
+
+    def invalidate(self, dotenv_path=None):
+        """
+        Forget a file, or all files
+        :param dotenv_path: env file, None for all
+        """
+        with self._lock:
+            if dotenv_path is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(os.path.abspath(dotenv_path), None)
+
+    @staticmethod
+    def _read_closure(f, index, key):
+        """
+        Read key and the keys of the file it refers to, transitively
+        :return: dict of raw values, None if an entry didn't parse as indexed
+        """
+        raw = {}
+        pending = [key]
+        while pending:
+            name = pending.pop()
+            if name in raw:
+                continue
+            for start, end in index.spans(name):
+                f.seek(start)
+                entry = _tokenize(_universal_newlines(f.read(end - start).decode(index.encoding)))
+                if len(entry) != 1:
+                    return None
+                if entry[0][0] == name:
+                    break
+                if not index.collisions:
+                    return None
+            else:
+                continue
+            value = raw[name] = entry[0][1]
+            if '${' in value:
+                # as resolve_nested_variables, the environment shadows the file and a self reference reads it
+                pending.extend(ref for ref in _referenced_names({name: value}) if ref != name and ref not in os.environ)
+        return raw
+
+    def _index(self, path, f, rebuild=False):
+        st = os.fstat(f.fileno())
+        signature = st.st_mtime_ns, st.st_size, st.st_ino
+        if not rebuild:
+            with self._lock:
+                index = self._indexes.get(path)
+            stale = index is None or index.signature != signature
+            if stale and self.cache_dir and _trusted_cache_dir(self.cache_dir):
+                index = _SpanTable.open(self._persisted_path(path), signature)
+            if index is not None and index.signature == signature:
+                self._remember(path, index)
+                return index
+
+        index = _SpanIndex.build(f, signature)
+        self._remember(path, index)
+        if self.cache_dir:
+            _write_cache_file(self.cache_dir, self._persisted_path(path), _SpanTable.dumps(index))
+        return index
+
+    def _remember(self, path, index):
+        with self._lock:
+            self._indexes[path] = index
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.maxsize:
+                self._indexes.popitem(last=False)
+
+    def _persisted_path(self, path):
+        name = hashlib.blake2b(os.fsencode(path), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f'{name}.dotenv-index')
+
+
+class _SpanIndex:
+    """ In memory index of a dotenv file, key -> (start, end) byte span of its last assignment """
+
+    collisions = False
+
+    def __init__(self, signature, encoding, spans):
+        self.signature = signature
+        self.encoding = encoding
+        self._spans = spans
+
+    def spans(self, name):
+        span = self._spans.get(name)
+        return () if span is None else (span, )
+
+    @classmethod
+    def build(cls, f, signature):
+        f.seek(0)
+        # decoded as parse_dotenv() reads it, newlines kept so character and byte positions line up.
+        # Entries are tokenized with universal newlines like parse_dotenv() and mapped back
+        encoding = io.text_encoding(None) if hasattr(io, 'text_encoding') else None
+        text_file = io.TextIOWrapper(f, encoding=encoding, newline='')
+        try:
+            encoding = text_file.encoding
+            text = text_file.read()
+        finally:
+            # leaves f open
+            text_file.detach()
+
+        spans = {}
+        entries = _tokenize_spans(text) if '\r' not in text else _universal_newline_spans(text)
+        if text.isascii():
+            for key, _, start, end in entries:
+                spans[key] = (start, end)
+        else:
+            position = offset = 0
+            for key, _, start, end in entries:
+                offset += len(text[position:start].encode(encoding))
+                length = len(text[start:end].encode(encoding))
+                spans[key] = (offset, offset + length)
+                position, offset = end, offset + length
+        return cls(signature, encoding, spans)
+
+
+class _SpanTable:
+    """
+    On-disk index of a dotenv file, an open addressing hash table of byte spans probed in place.
+    The header holds the format, the signature of the indexed file and its encoding, each slot
+    the (start, length) of an entry, length 0 for an empty slot. Slots are picked by the crc32
+    of the key, entries of other keys in the probe sequence are collisions.
+    """
+
+    collisions = True
+    _magic = b'KNOBSIDX'
+    _header = struct.Struct('<8sIqqqIB')
+    _slot = struct.Struct('<QI')
+
+    def __init__(self, path, signature, encoding, slots, offset):
+        self.path = path
+        self.signature = signature
+        self.encoding = encoding
+        self._slots = slots
+        self._offset = offset
+
+    @classmethod
+    def open(cls, path, signature):
+        """
+        :return: table of path if it indexes a file of signature, else None
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(cls._header.size + 255)
+        except OSError:
+            return None
+        if len(header) < cls._header.size:
+            return None
+        magic, version, mtime, size, ino, slots, encoding_length = cls._header.unpack_from(header)
+        offset = cls._header.size + encoding_length
+        if (magic, version, (mtime, size, ino)) != (cls._magic, _PERSIST_FORMAT, signature) or len(header) < offset:
+            return None
+        encoding = header[cls._header.size:offset].decode('ascii')
+        return cls(path, signature, encoding, slots, offset)
+
+    @classmethod
+    def dumps(cls, index):
+        """ The table of a _SpanIndex """
+        slots = 8
+        while slots < 2 * len(index._spans):
+            slots *= 2
+        table = bytearray(slots * cls._slot.size)
+        mask = slots - 1
+        for key, (start, end) in index._spans.items():
+            slot = _key_hash(key) & mask
+            while cls._slot.unpack_from(table, slot * cls._slot.size)[1]:
+                slot = (slot + 1) & mask
+            cls._slot.pack_into(table, slot * cls._slot.size, start, end - start)
+        encoding = index.encoding.encode('ascii')
+        header = cls._header.pack(cls._magic, _PERSIST_FORMAT, *index.signature, slots, len(encoding))
+        return header + encoding + table
+
+    def spans(self, name):
+        mask = self._slots - 1
+        slot = _key_hash(name) & mask
+        with open(self.path, 'rb') as f:
+            for _ in range(self._slots):
+                f.seek(self._offset + slot * self._slot.size)
+                start, length = self._slot.unpack(f.read(self._slot.size))
+                if not length:
+                    return
+                yield start, start + length
+                slot = (slot + 1) & mask
+
+
+def _key_hash(key):
+    # stable across processes, unlike hash()
+    return zlib.crc32(key.encode('utf-8', 'surrogatepass'))
+
+
+dotenv_index = DotenvIndex(cache_dir=os.environ.get(CACHE_DIR_ENV) or None)
+
+
+def _trusted_cache_dir(cache_dir):
+    """
+    Whether files in cache_dir may be loaded, the directory is owned by this user and nobody else can write to it
+    """
+    try:
+        st = os.stat(cache_dir)
+    except OSError:
+        return False
+    if not hasattr(os, 'getuid'):
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _write_cache_file(cache_dir, path, data):
+    """ Write a cache file atomically, caches are best effort and errors are ignored """
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.knobs-cache.', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
 
 
 def parse_dotenv(dotenv_path):
     """
     Parses the dotenv file, comments (#) are ignored.
     A key must have a '=' to mark it as a key. Strings without a '='
-    are ignored.
+    are ignored. Keys may carry an 'export' prefix, quoted values may span
+    lines and unquoted values may be followed by a ' # comment'.
 
     :param dotenv_path:
     :return: generator yielding (key,value)
     """
     with open(dotenv_path) as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#') or '=' not in line:
-                continue
-            k, v = line.split('=', 1)
+        text = f.read()
+    yield from _tokenize(text)
+
+
+def _tokenize(text):
+    """
+    Tokenize dotenv text in a single regex pass
 
-            # Remove any leading and trailing spaces in key, value
-            k, v = k.strip(), v.strip()
+    :param text: dotenv file content
+    :return: list of (key, value)
+    """
+    # unmatched groups are '', a raw value is only ever empty when the quoted ones are too
+    return [
+        (k.rstrip(), _raw_value(v) if v else _quoted_value(dq or sq))
+        for k, dq, sq, v in __dotenv_entry.findall(text)
+    ]
+
+
+def _tokenize_spans(text):
+    """
+    Tokenize dotenv text, keeping track of where each entry is
+
+    :param text: dotenv file content
+    :return: generator yielding (key, value, start, end), text[start:end] is the entry without its newline
+    """
+    for match in __dotenv_entry.finditer(text):
+        k, dq, sq, v = match.groups()
+        yield k.rstrip(), _raw_value(v) if v else _quoted_value(dq or sq), match.start(), match.end()
+
+
+def _universal_newlines(text):
+    """ text as read in universal newlines mode, \\r\\n and \\r are \\n """
+    if '\r' not in text:
+        return text
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _universal_newline_spans(text):
+    """
+    _tokenize_spans() of text read in universal newlines mode, with positions in text as it is
+
+    :param text: dotenv file content, newlines kept
+    :return: generator yielding (key, value, start, end)
+    """
+    # position in the translated text of each \r dropped from a \r\n
+    dropped = [match.start() - i for i, match in enumerate(re.finditer('\r\n', text))]
+    for key, value, start, end in _tokenize_spans(_universal_newlines(text)):
+        # an entry starts after the \r of a newline before it and ends before the \r of the newline after it
+        yield key, value, start + bisect.bisect_right(dropped, start), end + bisect.bisect_left(dropped, end)
+
+
+def _quoted_value(v):
+    if '\\' not in v:
+        return v
+    # escapes are decoded, characters outside ascii are kept as they are
+    return v.encode('latin-1', 'backslashreplace').decode('unicode_escape')
 
-            if len(v) > 0:
-                quoted = v[0] == v[len(v) - 1] in ['"', "'"]
 
-                if quoted:
-                    v = decode_escaped(v[1:-1])
+def _raw_value(v):
+    if '#' in v:
+        comment = __inline_comment.search(v)
+        if comment:
+            v = v[:comment.start()]
+    v = v.rstrip()
+    # a value like "a"b" is taken as quoted, as it always was
+    if len(v) > 1 and v[0] == v[-1] in ('"', "'"):
+        return _quoted_value(v[1:-1])
+    return v
 
-            yield k, v
+
+class InterpolationError(ValueError):
+    """ A ${VAR} reference that can't be resolved """
 
 
 def resolve_nested_variables(values):
-    def _replacement(name):
-        """
-        get appropriate value for a variable name.
-        first search in environ, if not found,
-        then look into the dotenv variables
-        """
-        ret = os.getenv(name, values.get(name, ""))
-        return ret
+    """
+    Expands ${VAR} references in place. A reference is looked up in the environment first,
+    then in values, where it is resolved in dependency order wherever it sits in the file.
+    ${VAR:-default} falls back to default and ${VAR:?message} fails when VAR is unset or empty.
+    A value referring to itself, like PATH=${PATH}:/opt/bin, refers to the environment.
 
-    def _re_sub_callback(match_object):
-        """
-        From a match object get the variable name and return
-        the correct replacement
-        """
-        return _replacement(match_object.group()[2:-1])
+    :param values: dict of dotenv values
+    :return: values
+    :raises: InterpolationError on a reference cycle or a failed ${VAR:?message}
+    """
+    # the reference graph, values without references never see the regex
+    references = {k: __posix_variable.findall(v) for k, v in values.items() if '${' in v}
+
+    def _dependencies(key):
+        return [
+            name for name, _, _ in references[key]
+            if name != key and name in references and name not in os.environ
+        ]
+
+    for key in _resolution_order(references, _dependencies):
 
-    for k, v in values.items():
-        values[k] = __posix_variable.sub(_re_sub_callback, v)
+        def _re_sub_callback(match_object, key=key):
+            """
+            get appropriate value for a variable name.
+            first search in environ, if not found,
+            then look into the dotenv variables
+            """
+            name, operator, argument = match_object.groups()
+            value = os.getenv(name)
+            if value is None and name != key:
+                value = values.get(name)
+            if not value:
+                if operator == '-':
+                    return argument
+                if operator == '?':
+                    raise InterpolationError(f'{key}: {name} {argument or "is not set"}')
+            return value or ''
+
+        values[key] = __posix_variable.sub(_re_sub_callback, values[key])
 
     return values
 
 
+def _referenced_names(values):
+    """ Names of all variables referred to by values """
+    return {name for v in values.values() if '${' in v for name, _, _ in __posix_variable.findall(v)}
+
+
+def _resolution_order(references, dependencies):
+    """
+    Depth first topological sort of the keys holding references, dependencies come first
+    :raises: InterpolationError on a cycle
+    """
+    order = []
+    done = set()
+    for root in references:
+        if root in done:
+            continue
+        path = [root]
+        on_path = {root}
+        stack = [iter(dependencies(root))]
+        while stack:
+            for dependency in stack[-1]:
+                if dependency in done:
+                    continue
+                if dependency in on_path:
+                    cycle = path[path.index(dependency):] + [dependency]
+                    raise InterpolationError(f'Variable reference cycle: {" -> ".join(cycle)}')
+                path.append(dependency)
+                on_path.add(dependency)
+                stack.append(iter(dependencies(dependency)))
+                break
+            else:
+                stack.pop()
+                key = path.pop()
+                on_path.discard(key)
+                done.add(key)
+                order.append(key)
+    return order
+
+
 def _get_format(value, quote_mode='always'):
     """
     Returns the quote format depending on the quote_mode.
@@ -201,21 +763,196 @@ def _get_format(value, quote_mode='always'):
     return formats.get(_mode)
 
 
+def _format_entry(key, value, quote_mode='always'):
+    """
+    :return: key=value line that parse_dotenv() reads back as value, a quoted value has \\ and " escaped
+    """
+    line_format = _get_format(value, quote_mode)
+    if '"' in line_format:
+        value = value.replace('\\', '\\\\').replace('"', '\\"')
+    return line_format.format(key=key, value=value)
+
+
 def flatten_and_write(dotenv_path, dotenv_as_dict, quote_mode='always'):
     """
     Writes dotenv_as_dict to dotenv_path, flattening the values
     :param dotenv_path: .env path
-    :param dotenv_as_dict: dict
+    :param dotenv_as_dict: dict, or an iterable of (key, value) written as it is consumed
     :param quote_mode:
     :return:
     """
-    with open(dotenv_path, 'w') as f:
-        for k, v in dotenv_as_dict.items():
-            str_format = _get_format(v, quote_mode)
-            f.write(str_format.format(key=k, value=v))
+    items = dotenv_as_dict.items() if hasattr(dotenv_as_dict, 'items') else dotenv_as_dict
+    _atomic_write(dotenv_path, (_format_entry(k, v, quote_mode) for k, v in items))
+    return True
+
+
+def _atomic_write(path, text):
+    """
+    Replace path with text, a crash leaves either the old or the new file, never a truncated one.
+    A symlinked path keeps its link, the file it points to is replaced with the same mode, owner and group.
+    :param path: file path
+    :param text: new content, a string or an iterable of lines
+    """
+    target = os.path.realpath(path)
+    dirname, basename = os.path.split(target)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{basename}.', dir=dirname)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            if isinstance(text, str):
+                f.write(text)
+            else:
+                f.writelines(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if not _copy_ownership(target, tmp_path):
+            # a new file gets the mode open() would have created it with, not the 0600 of mkstemp
+            os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, target)
+        for invalidated in {path, target}:
+            dotenv_cache.invalidate(invalidated)
+            dotenv_index.invalidate(invalidated)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    # persist the rename itself
+    dir_fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _umask():
+    # only readable by setting it
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def _copy_ownership(src, dst):
+    """
+    Give dst the mode, owner and group of src, if src exists. Owner and group only as far as permitted
+    :return: False if src doesn't exist
+    """
+    try:
+        st = os.stat(src)
+    except FileNotFoundError:
+        return False
+    shutil.copymode(src, dst)
+    if hasattr(os, 'chown'):
+        try:
+            os.chown(dst, st.st_uid, st.st_gid)
+        except PermissionError:
+            pass
     return True
 
 
+class DotenvEditor:
+    """
+    Edits a .env file in memory, comments and ordering are kept. The file is parsed once
+    and written back with a single atomic replace on commit, or when the with block exits cleanly.
+
+    >>> with DotenvEditor('.env') as dotenv:
+    ...     dotenv.set('JOLLY_ROGER_PIRATES', 124)
+    ...     dotenv.unset('PARROTS')
+    """
+
+    def __init__(self, dotenv_path, quote_mode='always'):
+        """
+        :param dotenv_path: env path, the file must exist
+        :param quote_mode: quote mode of set values
+        """
+        self.dotenv_path = dotenv_path
+        self.quote_mode = quote_mode
+        self.changed = False
+
+        with open(dotenv_path) as f:
+            text = f.read()
+
+        # file text split in verbatim runs and entry lines, entries are found by key in _entries
+        self._chunks = []
+        self._entries = {}
+        self._values = {}
+        pos = 0
+        for k, v, start, end in _tokenize_spans(text):
+            if text.startswith('\n', end):
+                end += 1
+            self._chunks.append(text[pos:start])
+            self._entries.setdefault(k, []).append(len(self._chunks))
+            self._chunks.append(text[start:end])
+            self._values[k] = v
+            pos = end
+        self._chunks.append(text[pos:])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self.changed:
+            self.commit()
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def keys(self):
+        return self._values.keys()
+
+    def set(self, key, value):
+        """
+        Adds or updates a key, a new key is appended to the end of the file
+        :param key: key
+        :param value: value
+        """
+        key = str(key)
+        value = str(value).strip("'").strip('"')
+        line = _format_entry(key, value, self.quote_mode)
+        positions = self._entries.get(key)
+        if positions:
+            # the last definition is the one that counts
+            self._chunks[positions[-1]] = line
+        else:
+            # the new line starts on a line of its own, after the last text of the file
+            last = next((i for i in reversed(range(len(self._chunks))) if self._chunks[i]), None)
+            if last is not None and not self._chunks[last].endswith('\n'):
+                self._chunks[last] += '\n'
+            self._entries[key] = [len(self._chunks)]
+            self._chunks.extend((line, ''))
+        self._values[key] = value
+        self.changed = True
+
+    def unset(self, key):
+        """
+        Removes every definition of key
+        :param key: key
+        :return: True if the key was in the file
+        """
+        key = str(key)
+        positions = self._entries.pop(key, None)
+        if not positions:
+            return False
+        for position in positions:
+            self._chunks[position] = ''
+        del self._values[key]
+        self.changed = True
+        return True
+
+    def commit(self):
+        """
+        Write the edits to the file atomically
+        :return: success flag
+        """
+        _atomic_write(self.dotenv_path, ''.join(self._chunks))
+        self.changed = False
+        return True
+
+
 def _walk_to_root(path):
     """
     Yield directories starting from the given directory up to the root
@@ -257,3 +994,70 @@ def find_dotenv(filename='.env', raise_error_if_not_found=False, usecwd=False):
         raise IOError('File not found')
 
     return ''
+
+
+def find_dotenvs(filenames=('.env',), raise_error_if_not_found=False, usecwd=False, max_age=0):
+    """
+    Search in increasingly higher folders for several files in a single walk
+
+    Returns every path found, in precedence order: by position in filenames first, then nearest
+    directory first. Results are cached per start directory and filenames, and revalidated
+    against the mtimes of the walked directories. Within max_age seconds of the last check a
+    cached result is returned without touching the file system.
+
+    :param filenames: file names, highest precedence first
+    :param raise_error_if_not_found: raise IOError if none of the files is found
+    :param usecwd: start from the working directory instead of the caller's file
+    :param max_age: seconds a cached result is trusted without revalidation
+    :return: list of paths
+    """
+    if usecwd or '__file__' not in globals():
+        path = os.getcwd()
+    else:
+        frame_filename = sys._getframe().f_back.f_code.co_filename
+        path = os.path.dirname(os.path.abspath(frame_filename))
+
+    filenames = tuple(filenames)
+    cache_key = (path, filenames)
+    now = time.monotonic()
+    cached = _find_dotenvs_cache.get(cache_key)
+    if cached is not None:
+        checked_at, dir_mtimes, matches = cached
+        if now - checked_at < max_age:
+            return _found(matches, raise_error_if_not_found)
+        if _mtimes_unchanged(dir_mtimes):
+            # only a confirmed entry starts a new max_age, a trusted hit doesn't extend it
+            _find_dotenvs_cache[cache_key] = (now, dir_mtimes, matches)
+            return _found(matches, raise_error_if_not_found)
+
+    dir_mtimes = []
+    found = {filename: [] for filename in filenames}
+    for dirname in _walk_to_root(path):
+        # stat before looking, a file created in between changes the mtime seen next time
+        dir_mtimes.append((dirname, os.stat(dirname).st_mtime_ns))
+        for filename in filenames:
+            check_path = os.path.join(dirname, filename)
+            if os.path.exists(check_path):
+                found[filename].append(check_path)
+
+    matches = tuple(match for filename in filenames for match in found[filename])
+    _find_dotenvs_cache[cache_key] = (now, tuple(dir_mtimes), matches)
+    return _found(matches, raise_error_if_not_found)
+
+
+def clear_find_dotenvs_cache():
+    """ Forget all cached find_dotenvs results """
+    _find_dotenvs_cache.clear()
+
+
+def _mtimes_unchanged(dir_mtimes):
+    try:
+        return all(os.stat(dirname).st_mtime_ns == mtime for dirname, mtime in dir_mtimes)
+    except OSError:
+        return False
+
+
+def _found(matches, raise_error_if_not_found):
+    if not matches and raise_error_if_not_found:
+        raise IOError('File not found')
+    return list(matches)
@@ -1,17 +1,211 @@
+import csv
+import io
 import os
 import sys
 import json
+import marshal
+import threading
+import time
 
-from json import JSONDecodeError
+from bisect import bisect_left
+from collections import namedtuple
+from collections.abc import Mapping
+from fnmatch import fnmatchcase
+from types import MappingProxyType
 
 import click
-import tabulate
 
-from environment import find_dotenv, load_dotenv
+from converters import BOOLEAN_TRUE_STRINGS, converter_type, get_converter
+from environment import _format_entry, find_dotenv, load_dotenv
 
-load_dotenv(find_dotenv(usecwd=True))
+# callbacks of knobs nobody subscribed to
+_NO_LISTENERS = ()
 
-BOOLEAN_TRUE_STRINGS = ('true', 'on', 'ok', 'y', 'yes', '1')
+# settings most knobs leave at their defaults. Knobs with the same settings share one, see _shared_meta()
+_KnobMeta = namedtuple('_KnobMeta', 'unit validator write_default')
+_knob_metas = {}
+
+# set to a true string to stop the first Knob.get() from loading the nearest .env
+NO_AUTOLOAD_ENV = 'KNOBS_NO_AUTOLOAD'
+
+_dotenv_loaded = False
+# held while .env loads, set _dotenv_loaded only once it's loaded so other threads wait for it
+_dotenv_lock = threading.RLock()
+
+# SourceChain consulted for variables that aren't in os.environ, see use_sources()
+_sources = None
+
+# env name -> default string get() wrote to os.environ, see Knob.written_default()
+_written_defaults = {}
+
+
+def load_env(dotenv_path=None):
+    """
+    Load a .env file into the environment, variables already set are kept.
+    Loading explicitly replaces the automatic load on first Knob.get()
+
+    :param dotenv_path: .env path, defaults to the nearest .env from the working directory
+    :return: success flag
+    """
+    global _dotenv_loaded
+    with _dotenv_lock:
+        if dotenv_path is None:
+            dotenv_path = find_dotenv(usecwd=True)
+        loaded = load_dotenv(dotenv_path)
+        _dotenv_loaded = True
+    return loaded
+
+
+def use_sources(sources):
+    """
+    Read variables missing from the environment from layered sources instead of loading a .env
+    into it. Values of the sources are never copied into os.environ, and neither are defaults while
+    sources are in use.
+    >>> use_sources(SourceChain([DotenvSource('.env.local'), DotenvSource('.env')]))
+
+    :param sources: sources.SourceChain, None to stop using it
+    :return: sources
+    """
+    global _dotenv_loaded, _sources
+    _dotenv_loaded = True
+    _sources = sources
+    Knob.invalidate_registry()
+    return sources
+
+
+def export_knobs():
+    """
+    Serialize the environment strings of the registered knobs, as resolved here from the environment,
+    .env and sources, for install_knobs() in worker processes. Serialized once, handing the bytes to
+    many workers is a copy.
+
+    :return: bytes
+    """
+    if not _dotenv_loaded:
+        _autoload()
+    values = {}
+    for name, _ in Knob._registered():
+        value = os.environ.get(name)
+        if value is None and _sources is not None:
+            value = _sources.get(name)
+        if value is not None:
+            values[name] = value
+    return marshal.dumps(values)
+
+
+def install_knobs(exported):
+    """
+    Pool initializer making the knob values exported by the parent visible in a worker, which then
+    skips loading .env. They are layered behind the worker's environment and in front of its sources,
+    and not copied into os.environ.
+
+    :param exported: bytes from export_knobs()
+    """
+    global _dotenv_loaded, _sources
+    _dotenv_loaded = True
+    _sources = ExportedKnobs(marshal.loads(exported), _sources)
+    Knob.invalidate_registry()
+
+
+def pool_initializer():
+    """
+    Initializer and arguments handing the parent's knob values to process pool workers
+    >>> pool = multiprocessing.get_context('spawn').Pool(64, *pool_initializer())
+
+    :return: (install_knobs, (exported, ))
+    """
+    return install_knobs, (export_knobs(), )
+
+
+class ExportedKnobs:
+    """ Knob values installed by install_knobs(), in front of the sources used before """
+
+    def __init__(self, values, sources=None):
+        """
+        :param values: dict of env name -> environment string
+        :param sources: sources consulted for names not in values
+        """
+        self.values = values
+        self.sources = sources
+
+    def get(self, name):
+        value = self.values.get(name)
+        if value is None and self.sources is not None:
+            value = self.sources.get(name)
+        return value
+
+
+def _environ_value(name):
+    """ The string a knob reads, from the environment or the sources """
+    value = os.environ.get(name)
+    if value is None and _sources is not None:
+        value = _sources.get(name)
+    return value
+
+
+def _autoload():
+    """ Load the nearest .env once, unless disabled by KNOBS_NO_AUTOLOAD """
+    global _dotenv_loaded
+    with _dotenv_lock:
+        if _dotenv_loaded:
+            return
+        if os.getenv(NO_AUTOLOAD_ENV, '').lower() in BOOLEAN_TRUE_STRINGS:
+            _dotenv_loaded = True
+            return
+        try:
+            load_dotenv(find_dotenv(usecwd=True))
+        finally:
+            _dotenv_loaded = True
+
+
+class KnobIndex:
+    """
+    Registered knob names kept sorted for prefix range lookups. Names registered out of order are
+    appended and sorted once on the next lookup, so bulk registration stays linear
+    """
+
+    __slots__ = ('_names', '_sorted')
+
+    def __init__(self):
+        self._names = []
+        self._sorted = True
+
+    def add(self, name):
+        """ Add a name that isn't in the index yet """
+        names = self._names
+        if names and name < names[-1]:
+            self._sorted = False
+        names.append(name)
+
+    def prefixed(self, prefix):
+        """
+        :param prefix: name prefix, '' for all
+        :return: sorted list of the names starting with prefix
+        """
+        names = self._names
+        if not self._sorted:
+            names.sort()
+            self._sorted = True
+        if not prefix:
+            return names[:]
+        start = end = bisect_left(names, prefix)
+        while end < len(names) and names[end].startswith(prefix):
+            end += 1
+        return names[start:end]
+
+    def __len__(self):
+        return len(self._names)
+
+
+def _shared_meta(unit, validator, write_default):
+    """
+    :return: the _KnobMeta of these settings, one instance for all knobs that have them. Settings with a
+             validator aren't shared, validators are often made per knob and would be kept forever
+    """
+    meta = _KnobMeta(unit, validator, write_default)
+    if validator is not None:
+        return meta
+    return _knob_metas.setdefault(meta, meta)
 
 
 class Knob:
@@ -37,7 +231,39 @@ class Knob:
     True
     """
 
+    # slotted, a registry of tens of thousands of knobs carries no per knob __dict__.
+    # Subclasses without __slots__ get a __dict__ as usual
+    __slots__ = (
+        '_cast',
+        '_converter',
+        'env_name',
+        'default',
+        'description',
+        '_meta',
+        'cache',
+        '_cached',
+        '_listeners',
+        '_stats',
+    )
+
     _register = {}
+    # sorted names of the registry, for prefix lookups and ordered iteration
+    _index = KnobIndex()
+    _register_lock = threading.RLock()
+    _registry_listeners = []
+    _last_snapshot = None
+
+    # read instrumentation, see enable_stats(). Knobs hold their KnobStats while enabled, None otherwise
+    _stats_enabled = False
+    _stats_records = {}
+
+    # get() writes the default to the environment when the variable is not set,
+    # set it False to read without mutating os.environ. A knob's own write_default argument wins
+    write_default = True
+
+    # format of the print_knobs_table and print_current_knobs_table click callbacks, see write_knobs().
+    # 'table' streams, the tabulate grid is built in memory
+    output_format = 'fancy_grid'
 
     def __init__(
         self,
@@ -46,6 +272,9 @@ class Knob:
         unit: str = '',
         description: str = '',
         validator=None,
+        cache: bool = False,
+        kind=None,
+        write_default=None,
     ):
         """
         :param env_name: Name of environment variable
@@ -53,23 +282,68 @@ class Knob:
         :param unit: Unit description
         :param description: What does this knob do
         :param validator: Callable to validate value
+        :param cache: Keep the cast and validated value until the environment string changes
+        :param kind: converter of the environment string, a type or a name like 'duration', 'size' or 'json'.
+                     Defaults to the default's type, see converters.register_converter()
+        :param write_default: write the default to the environment on a miss, None follows Knob.write_default
         """
 
-        # the default's type sets the python type of the value
+        # the default's type or the kind sets the python type of the value
         # retrieved from the environment
-        self._cast = type(default)
+        cast = type(default)
+        if kind is None:
+            kind = cast
+        # picked once, get() calls it without looking at the type again
+        self._converter = get_converter(kind, cast)
+        self._cast = converter_type(kind, cast)
 
-        self.env_name = env_name
+        # interned, the registry key, os.environ lookups and the knob share one string
+        self.env_name = env_name = sys.intern(env_name)
         self.default = default
-        self.unit = unit
         self.description = description
-        self.validator = validator
+        # unit, validator and write_default, shared with the knobs that have the same
+        self._meta = _shared_meta(unit, validator, write_default)
+        self.cache = cache
+
+        # (raw environment string, cast value) of the last cached lookup
+        self._cached = None
+        # shared until a callback is registered, see _listener_list()
+        self._listeners = _NO_LISTENERS
+        self._stats = Knob._stats_record(env_name) if Knob._stats_enabled else None
 
-        self._register[env_name] = self
+        with self._register_lock:
+            register = self._register
+            if env_name not in register:
+                self._index.add(env_name)
+            register[env_name] = self
 
     def __call__(self):
         return self.get()
 
+    @property
+    def unit(self):
+        return self._meta.unit
+
+    @unit.setter
+    def unit(self, value):
+        self._meta = _shared_meta(*self._meta._replace(unit=value))
+
+    @property
+    def validator(self):
+        return self._meta.validator
+
+    @validator.setter
+    def validator(self, value):
+        self._meta = _shared_meta(*self._meta._replace(validator=value))
+
+    def _writes_default(self):
+        """ Whether a miss writes the default to the environment, the knob's own setting or Knob.write_default """
+        if _sources is not None:
+            # a source may hold the name later, a written default would shadow it
+            return False
+        write_default = self._meta.write_default
+        return self.write_default if write_default is None else write_default
+
     def get_type(self):
         """ The type of this knob """
         return self._cast
@@ -86,6 +360,8 @@ class Knob:
         :return:
         """
         del os.environ[self.env_name]
+        _written_defaults.pop(self.env_name, None)
+        self._changed()
 
     def set(self, value):
         """
@@ -93,37 +369,116 @@ class Knob:
         This is useful when the default gets mutated by the cli
         """
         os.environ[self.env_name] = str(value)
+        _written_defaults.pop(self.env_name, None)
+        self._changed()
+
+    def invalidate(self):
+        """ Drop the cached value, the next get() casts the environment again """
+        self._cached = None
+
+    def on_change(self, callback):
+        """
+        Register a callback called with the knob whenever its environment variable is changed
+        through set(), rm() or a dotenv reload. Usable as a decorator.
+        :param callback: callable taking the knob
+        :return: callback
+        """
+        self._listener_list().append(callback)
+        return callback
+
+    def _listener_list(self):
+        """ The callback list of this knob, created on first use """
+        if self._listeners is _NO_LISTENERS:
+            with self._register_lock:
+                if self._listeners is _NO_LISTENERS:
+                    self._listeners = []
+        return self._listeners
+
+    def _changed(self):
+        """ The environment variable changed, drop the cached value and notify the listeners """
+        self.invalidate()
+        stats = self._stats
+        if stats is not None:
+            stats.last_change = time.time()
+        # copies, listeners may unsubscribe from other threads
+        for callback in tuple(self._listeners):
+            callback(self)
+        for callback in tuple(self._registry_listeners):
+            callback(self)
+
+    async def changed(self):
+        """
+        Wait for the next change of this knob
+        >>> value = await pirates.changed()
+
+        :return: the new value
+        """
+        # asyncio is only imported by those who use it
+        from knobs_async import KnobSubscription
+        with KnobSubscription(self) as subscription:
+            await subscription.get()
+        return self.get()
+
+    async def changes(self):
+        """
+        Iterate the values of this knob as it changes
+        >>> async for value in pirates.changes():
+        ...     print(value)
+        """
+        from knobs_async import KnobSubscription
+        with KnobSubscription(self) as subscription:
+            async for _ in subscription:
+                yield self.get()
 
     def get(self):
+        if not _dotenv_loaded:
+            _autoload()
+
         source_value = os.getenv(self.env_name)
+        if source_value is None and _sources is not None:
+            source_value = _sources.get(self.env_name)
+        stats = self._stats
+        if stats is not None:
+            stats.read(source_value)
+
         # set the environment if it is not set
         if source_value is None:
-            os.environ[self.env_name] = str(self.default)
+            if self._writes_default():
+                os.environ[self.env_name] = _written_defaults[self.env_name] = str(self.default)
             return self.default
 
-        # bool
-        if self._cast == bool:
-            if isinstance(source_value, str):
-                return source_value.lower() in BOOLEAN_TRUE_STRINGS
-            if isinstance(source_value, bool):
-                return source_value
+        if not self.cache:
+            return self._convert(source_value) if stats is None else stats.convert(self, source_value)
 
-        # list
-        if self._cast == list:
-            return source_value.split()
+        cached = self._cached
+        if cached is not None and cached[0] == source_value:
+            if stats is not None:
+                stats.hits += 1
+            return cached[1]
 
-        # tuple
-        if self._cast == tuple:
-            return tuple(source_value.split())
+        if stats is None:
+            val = self._convert(source_value)
+        else:
+            stats.misses += 1
+            val = stats.convert(self, source_value)
+        self._cached = (source_value, val)
+        return val
 
+    def _convert(self, source_value):
+        """
+        Cast and validate a raw environment string, exits with a message naming the knob when it can't be cast
+        :param source_value: environment string
+        :return: value of the knob's type
+        """
         try:
-            val = self._cast(source_value)
+            val = self._converter(source_value)
         except ValueError as e:
-            click.secho(e.message, err=True, color='red')
+            click.secho(f"Environment name '{self.env_name}' failed with '{source_value}', {e}", err=True, fg='red')
             sys.exit(1)
 
-        if self.validator:
-            val = self.validator(val)
+        validator = self._meta.validator
+        if validator:
+            val = validator(val)
 
         return val
 
@@ -143,35 +498,320 @@ class Knob:
     @classmethod
     def clear_registry(cls):
         """ Clear knob registry """
-        cls._register = {}
+        with cls._register_lock:
+            cls._register = {}
+            cls._index = KnobIndex()
+            # knobs still referenced keep theirs, new knobs share new ones
+            _knob_metas.clear()
+
+    @classmethod
+    def _registered(cls):
+        """ (name, knob) pairs of the registry sorted by name, safe against concurrent registration """
+        return cls.by_prefix('')
+
+    @classmethod
+    def by_prefix(cls, prefix):
+        """
+        Registered knobs whose name starts with prefix, looked up in the sorted name index
+        >>> Knob.by_prefix('JOLLY_')
+        [('JOLLY_ROGER_PIRATES', Knob('JOLLY_ROGER_PIRATES', 124, unit='', description='Yar', validator=None))]
+
+        :param prefix: name prefix, '' for all
+        :return: list of (name, knob) sorted by name
+        """
+        with cls._register_lock:
+            register = cls._register
+            return [(name, register[name]) for name in cls._index.prefixed(prefix)]
+
+    @classmethod
+    def namespace(cls, prefix):
+        """
+        The group of knobs whose name starts with prefix
+        >>> Knob.namespace('DB_').resolve()
+        {'DB_HOST': 'localhost', 'DB_PORT': 5432}
+
+        :param prefix: name prefix
+        :return: KnobNamespace, a live view of the registry
+        """
+        return KnobNamespace(cls, prefix)
+
+    @classmethod
+    def on_any_change(cls, callback):
+        """
+        Register a callback called with the knob whenever any knob changes
+        :param callback: callable taking the knob
+        :return: callback
+        """
+        cls._registry_listeners.append(callback)
+        return callback
+
+    @classmethod
+    async def registry_changes(cls):
+        """
+        Iterate the knobs of the registry as they change
+        >>> async for knob in Knob.registry_changes():
+        ...     print(knob.env_name, knob.get())
+        """
+        from knobs_async import KnobSubscription
+        with KnobSubscription() as subscription:
+            async for knob in subscription:
+                yield knob
+
+    @classmethod
+    def written_default(cls, name):
+        """
+        The default get() wrote to the environment, so loaders can tell it from a variable set by the environment
+        :param name: environment variable name
+        :return: the default string, None if the variable holds anything else
+        """
+        value = _written_defaults.get(name)
+        return value if value is not None and os.environ.get(name) == value else None
+
+    @classmethod
+    def notify_changed(cls, names):
+        """
+        Tell the knobs of the given environment variables that their value changed
+        :param names: environment variable names, names without a knob are skipped
+        """
+        for name in names:
+            knob = cls._register.get(name)
+            if knob is not None:
+                knob._changed()
+
+    @classmethod
+    def invalidate_registry(cls):
+        """ Drop the cached values of all registered knobs """
+        with cls._register_lock:
+            knobs = list(cls._register.values())
+        for knob in knobs:
+            knob.invalidate()
+
+    @classmethod
+    def snapshot(cls, previous=None):
+        """
+        Resolve every registered knob in one pass into an immutable mapping, lists and dicts are frozen
+        like cached ListKnob values. Values of knobs whose environment string didn't change since the
+        previous snapshot are reused, so taking one per request or tick is cheap.
+        >>> Knob.snapshot().JOLLY_ROGER_PIRATES
+        124
+
+        :param previous: snapshot to reuse values from, defaults to the last one taken
+        :return: KnobSnapshot
+        """
+        if not _dotenv_loaded:
+            _autoload()
+
+        if previous is None:
+            previous = cls._last_snapshot
+        previous_entries = previous._entries if previous is not None else {}
+
+        with cls._register_lock:
+            items = list(cls._register.items())
+
+        getenv = os.environ.get
+        entries = {}
+        for name, knob in items:
+            # read before get(), a change in between then shows up in the next snapshot
+            source_value = getenv(name)
+            if source_value is None and _sources is not None:
+                source_value = _sources.get(name)
+            entry = previous_entries.get(name)
+            if entry is None or entry[0] is not knob or entry[1] != source_value:
+                # frozen like cached ListKnob values, entries are shared by later snapshots
+                entry = (knob, source_value, freeze(knob.get()))
+            entries[name] = entry
+
+        snapshot = KnobSnapshot(entries)
+        cls._last_snapshot = snapshot
+        return snapshot
+
+    @classmethod
+    def _stats_record(cls, name):
+        """ The KnobStats of an environment name, created on first use """
+        stats = Knob._stats_records.get(name)
+        if stats is None:
+            stats = Knob._stats_records.setdefault(name, KnobStats())
+        return stats
+
+    @classmethod
+    def enable_stats(cls, enabled=True):
+        """
+        Record read counts, cache hits and misses, cast and validator time and the last change of every knob,
+        including knobs registered later. Disabled, get() pays a single attribute check.
+        Counters are updated without locking and may miss a few reads under heavy thread contention.
+
+        :param enabled: False stops recording, the recorded stats are kept until reset_stats()
+        """
+        with cls._register_lock:
+            Knob._stats_enabled = enabled
+            for name, knob in Knob._register.items():
+                knob._stats = cls._stats_record(name) if enabled else None
+
+    @classmethod
+    def disable_stats(cls):
+        """ Stop recording knob stats """
+        cls.enable_stats(False)
+
+    @classmethod
+    def reset_stats(cls):
+        """ Forget the recorded stats, recording continues if enabled """
+        with cls._register_lock:
+            Knob._stats_records = {}
+            enabled = Knob._stats_enabled
+        cls.enable_stats(enabled)
+
+    @classmethod
+    def read_stats(cls):
+        """
+        :return: env name -> KnobStats of every knob read since stats were enabled
+        """
+        return {name: stats for name, stats in Knob._stats_records.items() if stats.reads}
+
+    @classmethod
+    def hot_knobs(cls, limit=10):
+        """
+        The most read knobs
+        :param limit: number of knobs, None for all
+        :return: list of (env name, KnobStats), most reads first
+        """
+        hot = sorted(cls.read_stats().items(), key=lambda item: (-item[1].reads, item[0]))
+        return hot if limit is None else hot[:limit]
+
+    @classmethod
+    def write_hot_knobs(cls, file, limit=10):
+        """
+        Write the hot_knobs() as a plain table
+        :param file: text file object
+        :param limit: number of knobs, None for all
+        """
+        hot = cls.hot_knobs(limit)
+        headers = ('Knob', 'Reads', 'Hits', 'Misses', 'Cast ms', 'Last change')
+        rows = [
+            (
+                name,
+                stats.reads,
+                stats.hits,
+                stats.misses,
+                f'{stats.convert_time * 1000:.3f}',
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stats.last_change)) if stats.last_change else '',
+            ) for name, stats in hot
+        ]
+        widths = [max([len(header)] + [len(str(row[i])) for row in rows]) for i, header in enumerate(headers)]
+        line = '  '.join(f'{{:<{width}}}' for width in widths) + '\n'
+        file.write(line.format(*headers).rstrip() + '\n')
+        file.write(line.format(*('-' * width for width in widths)).rstrip() + '\n')
+        for row in rows:
+            file.write(line.format(*row).rstrip() + '\n')
+
+    @classmethod
+    def print_hot_knobs(cls, ctx, param, value):
+        """ Click callback, records knob stats while the command runs and prints the hottest knobs to stderr after """
+        if not value or ctx.resilient_parsing:
+            return
+        cls.enable_stats()
+        ctx.call_on_close(lambda: cls.write_hot_knobs(sys.stderr))
 
     @classmethod
     def print_knobs_table(cls, ctx, param, value):
         if not value or ctx.resilient_parsing:
             return
-        click.echo(cls.get_knob_defaults_as_table())
+        cls.write_knobs(sys.stdout, cls.output_format)
         ctx.exit()
 
     @classmethod
     def print_current_knobs_table(cls, ctx, param, value):
         if not value or ctx.resilient_parsing:
             return
-        click.echo(cls.get_knobs_current_as_table())
+        cls.write_knobs(sys.stdout, cls.output_format, current=True)
         ctx.exit()
 
+    @classmethod
+    def iter_knobs(cls, prefix='', pattern=None):
+        """
+        Registered knobs sorted by name
+        :param prefix: only knobs whose name starts with prefix
+        :param pattern: only knobs whose name matches this shell style pattern
+        :return: generator yielding (name, knob)
+        """
+        for name, knob in cls.by_prefix(prefix):
+            if pattern is None or fnmatchcase(name, pattern):
+                yield name, knob
+
+    @classmethod
+    def write_knobs(cls, file, fmt='table', current=False, prefix='', pattern=None):
+        """
+        Streams the registry to a file object a row at a time, rows are never collected in memory
+
+        :param file: text file object
+        :param fmt: 'table', 'jsonl', 'csv', 'dotenv' or 'fancy_grid'. Defaults are written as a commented out
+                    dotenv template, current values as quoted active lines holding the environment string.
+                    'fancy_grid' is the tabulate grid of get_knob_defaults_as_table(), built in memory
+        :param current: current values instead of defaults
+        :param prefix: only knobs whose name starts with prefix
+        :param pattern: only knobs whose name matches this shell style pattern
+        """
+        value_header = 'Value' if current else 'Default'
+        rows = (
+            (name, knob.description, knob.get() if current else knob.default)
+            for name, knob in cls.iter_knobs(prefix, pattern)
+        )
+
+        if fmt == 'table':
+            # a first pass over the registry sizes the columns, the value column comes last and is not padded
+            name_width, description_width = len('Knob'), len('Description')
+            for name, knob in cls.iter_knobs(prefix, pattern):
+                name_width = max(name_width, len(name))
+                description_width = max(description_width, len(knob.description))
+            line = f'{{:<{name_width}}}  {{:<{description_width}}}  {{}}\n'
+            file.write(line.format('Knob', 'Description', value_header))
+            file.write(line.format('-' * name_width, '-' * description_width, '-' * len(value_header)))
+            for row in rows:
+                file.write(line.format(*row))
+        elif fmt == 'jsonl':
+            for name, description, value in rows:
+                file.write(json.dumps({'Knob': name, 'Description': description, value_header: value}, default=str))
+                file.write('\n')
+        elif fmt == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(('Knob', 'Description', value_header))
+            writer.writerows(rows)
+        elif fmt == 'dotenv':
+            separator = ''
+            for name, description, value in rows:
+                file.write(f'{separator}# {description}\n')
+                if current:
+                    # quoted and escaped, so the file reads back to the same environment strings
+                    source_value = _environ_value(name)
+                    value = str(value) if source_value is None else source_value
+                    file.write(_format_entry(name, value))
+                else:
+                    file.write(f'# {name}={value}\n')
+                separator = '\n'
+        elif fmt == 'fancy_grid':
+            import tabulate
+            table = [
+                {'Knob': name, 'Description': description, value_header: value} for name, description, value in rows
+            ]
+            file.write(tabulate.tabulate(table, headers='keys', tablefmt='fancy_grid'))
+            file.write('\n')
+        else:
+            raise ValueError(f"Unknown format '{fmt}'")
+
     @classmethod
     def get_knob_defaults_as_table(cls):
         """
         Renders knobs in table
         :return:
         """
+        # tabulate is slow to import and only needed here, keep it off the import path
+        import tabulate
 
         knob_list = [
             {
                 'Knob': name,
-                'Description': cls.get_registered_knob(name).description,
-                'Default': cls.get_registered_knob(name).default
-            } for name in sorted(cls._register.keys())
+                'Description': knob.description,
+                'Default': knob.default
+            } for name, knob in cls._registered()
         ]
         return tabulate.tabulate(knob_list, headers='keys', tablefmt='fancy_grid')
 
@@ -181,13 +821,14 @@ class Knob:
         Renders current knob values in table
         :return:
         """
+        import tabulate
 
         knob_list = [
             {
                 'Knob': name,
-                'Description': cls.get_registered_knob(name).description,
-                'Value': cls.get_registered_knob(name)(),
-            } for name in sorted(cls._register.keys())
+                'Description': knob.description,
+                'Value': knob(),
+            } for name, knob in cls._registered()
         ]
         return tabulate.tabulate(knob_list, headers='keys', tablefmt='fancy_grid')
 
@@ -195,7 +836,9 @@ class Knob:
     def print_knobs_env(cls, ctx, param, value):
         if not value or ctx.resilient_parsing:
             return
-        click.echo(cls.get_knob_defaults())
+        cls.write_knobs(sys.stdout, 'dotenv')
+        # the blank line click.echo() of get_knob_defaults() always ended with
+        sys.stdout.write('\n')
         ctx.exit()
 
     @classmethod
@@ -205,46 +848,314 @@ class Knob:
         '# \n# HAVE_RUM=True\n\n# Yar\n# JOLLY_ROGER_PIRATES=124\n\n# Foo Bar\n# WUNDER=BAR\n'
         """
 
-        return '\n'.join(
-            [
-                '# {description}\n# {knob}={default}\n'.format(
-                    description=cls.get_registered_knob(name).description,
-                    knob=name,
-                    default=cls.get_registered_knob(name).default
-                ) for name in sorted(cls._register.keys())
-            ]
-        )
+        out = io.StringIO()
+        cls.write_knobs(out, 'dotenv')
+        return out.getvalue()
 
 
 class ListKnob(Knob):
     """
     A specialised Knob that expects its value to be a json list environment variable like:
     ENV_LIST_EXAMPLE='["Foo", "bar"]'
+
+    Cached list knobs decode the json once per environment string and return it frozen,
+    lists as tuples and objects as read-only mappings, so callers can't corrupt the cache.
     """
 
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('kind', 'json')
+        super().__init__(*args, **kwargs)
+        self._cast = list
+
     def get(self):
         """
         convert json env variable if set to list
         """
 
-        self._cast = type([])
+        if not _dotenv_loaded:
+            _autoload()
+
         source_value = os.getenv(self.env_name)
+        if source_value is None and _sources is not None:
+            source_value = _sources.get(self.env_name)
+        stats = self._stats
+        if stats is not None:
+            stats.read(source_value)
 
         # set the environment if it is not set
         if source_value is None:
-            os.environ[self.env_name] = json.dumps(self.default)
-            return self.default
+            if self._writes_default():
+                source_value = json.dumps(self.default)
+                os.environ[self.env_name] = _written_defaults[self.env_name] = source_value
+            if not self.cache:
+                return self.default
+            # keyed on what the next get() reads, the written default or still nothing
+            cached = self._cached
+            if cached is None or cached[0] != source_value:
+                cached = self._cached = (source_value, freeze(self.default))
+            return cached[1]
 
-        try:
-            val = json.loads(source_value)
-        except JSONDecodeError as e:
-            click.secho(f"Environment name '{self.env_name}' failed with '{source_value}', {e}", err=True, color='red')
-            sys.exit(1)
-        except ValueError as e:
-            click.secho(f"Environment name '{self.env_name}' failed with '{source_value}', {e}", err=True, color='red')
-            sys.exit(1)
+        if not self.cache:
+            return self._convert(source_value) if stats is None else stats.convert(self, source_value)
 
-        if self.validator:
-            val = self.validator(val)
+        cached = self._cached
+        if cached is not None and cached[0] == source_value:
+            if stats is not None:
+                stats.hits += 1
+            return cached[1]
 
+        if stats is None:
+            val = freeze(self._convert(source_value))
+        else:
+            stats.misses += 1
+            val = freeze(stats.convert(self, source_value))
+        self._cached = (source_value, val)
         return val
+
+
+def freeze(value):
+    """
+    Recursively convert decoded json to immutable structures
+    >>> freeze([1, [2, 3], {'a': [4]}])
+    (1, (2, 3), mappingproxy({'a': (4,)}))
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    return value
+
+
+class KnobNamespace(Mapping):
+    """
+    Live view of the registered knobs whose name starts with a prefix, by full env name
+    >>> db = Knob.namespace('DB_')
+    >>> db['DB_PORT'].get()
+    5432
+    """
+
+    def __init__(self, knob_class, prefix):
+        self.knob_class = knob_class
+        self.prefix = prefix
+
+    def items(self):
+        """ (name, knob) pairs sorted by name """
+        return self.knob_class.by_prefix(self.prefix)
+
+    def knobs(self):
+        """ The knobs of the namespace sorted by name """
+        return [knob for _, knob in self.items()]
+
+    def __getitem__(self, name):
+        knob = self.knob_class.get_registered_knob(name) if name.startswith(self.prefix) else None
+        if knob is None:
+            raise KeyError(name)
+        return knob
+
+    def __iter__(self):
+        return iter([name for name, _ in self.items()])
+
+    def __len__(self):
+        return len(self.items())
+
+    def resolve(self):
+        """
+        :return: dict of name -> current value of every knob in the namespace
+        """
+        return {name: knob.get() for name, knob in self.items()}
+
+    def reset(self):
+        """ Remove the environment variables of the namespace, the knobs fall back to their defaults """
+        for name, knob in self.items():
+            if name in os.environ:
+                knob.rm()
+
+    def invalidate(self):
+        """ Drop the cached values of the namespace """
+        for knob in self.knobs():
+            knob.invalidate()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.prefix!r})'
+
+
+class KnobConfig:
+    """
+    Declarative group of knobs. Knobs declared as class attributes resolve in one pass into an
+    instance of a generated slotted subclass, so reading a field is a plain attribute read.
+    >>> class Database(KnobConfig):
+    ...     __slots__ = ()
+    ...     host = Knob('DB_HOST', 'localhost')
+    ...     port = Knob('DB_PORT', 5432)
+    >>> db = Database.resolve()
+    >>> db.port
+    5432
+    >>> Database.port
+    Knob('DB_PORT', 5432, unit='', description='', validator=None)
+
+    Subclasses and their mixins declare empty __slots__, or every resolved instance would carry a __dict__.
+    Fields don't follow the environment by themselves, refresh() resolves the fields whose
+    environment string changed.
+    """
+
+    __slots__ = ()
+
+    # (field name, knob) of the class and its bases
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if '_resolved_fields' in cls.__dict__:
+            # the generated slotted class
+            return
+        unslotted = [base.__qualname__ for base in cls.__mro__[:-1] if '__slots__' not in base.__dict__]
+        if unslotted:
+            raise TypeError(f"{', '.join(unslotted)} must declare __slots__ = (), resolved configs carry no __dict__")
+        fields = dict(cls._fields)
+        fields.update((name, value) for name, value in cls.__dict__.items() if isinstance(value, Knob))
+        cls._fields = tuple(fields.items())
+        cls._resolved_class = None
+
+    @classmethod
+    def resolve(cls):
+        """
+        :return: instance holding the current value of every field
+        """
+        if not _dotenv_loaded:
+            _autoload()
+
+        resolved_class = cls.__dict__.get('_resolved_class')
+        if resolved_class is None:
+            names = tuple(name for name, _ in cls._fields)
+            namespace = {
+                '__slots__': names + ('_raw', ),
+                '__module__': cls.__module__,
+                '__qualname__': cls.__qualname__,
+                '_resolved_fields': names,
+            }
+            resolved_class = cls._resolved_class = type(cls.__name__, (cls, ), namespace)
+
+        config = object.__new__(resolved_class)
+        raw = []
+        for name, knob in cls._fields:
+            source_value = _environ_value(knob.env_name)
+            object.__setattr__(config, name, knob.get())
+            if source_value is None:
+                # get() may have written the default
+                source_value = _environ_value(knob.env_name)
+            raw.append(source_value)
+        object.__setattr__(config, '_raw', raw)
+        return config
+
+    def refresh(self):
+        """
+        Resolve the fields whose environment string changed since they were resolved
+        :return: list of the refreshed field names
+        """
+        raw = self._raw
+        changed = []
+        for i, (name, knob) in enumerate(self._fields):
+            source_value = _environ_value(knob.env_name)
+            if source_value != raw[i]:
+                object.__setattr__(self, name, knob.get())
+                if source_value is None:
+                    source_value = _environ_value(knob.env_name)
+                raw[i] = source_value
+                changed.append(name)
+        return changed
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is read-only, set the knob instead')
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name, None)!r}' for name, _ in self._fields)
+        return f'{self.__class__.__name__}({fields})'
+
+
+class KnobStats:
+    """
+    Read instrumentation of a knob, see Knob.enable_stats()
+
+    reads: get() calls
+    hits, misses: value cache lookups of cached knobs
+    converts, convert_time: casts and validations and the seconds spent in them
+    last_change: time.time() of the last set(), rm(), reload or environment change seen by get(), None if never
+    """
+
+    __slots__ = ('reads', 'hits', 'misses', 'converts', 'convert_time', 'last_change', '_source_value')
+
+    def __init__(self):
+        self.reads = 0
+        self.hits = 0
+        self.misses = 0
+        self.converts = 0
+        self.convert_time = 0.0
+        self.last_change = None
+        self._source_value = None
+
+    def read(self, source_value):
+        """ Count a read of the environment string source_value """
+        if self.reads and source_value != self._source_value:
+            self.last_change = time.time()
+        self._source_value = source_value
+        self.reads += 1
+
+    def convert(self, knob, source_value):
+        """ Time the cast and validation of source_value by the knob """
+        start = time.perf_counter()
+        try:
+            return knob._convert(source_value)
+        finally:
+            self.convert_time += time.perf_counter() - start
+            self.converts += 1
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(reads={self.reads}, hits={self.hits}, misses={self.misses}, '
+            f'converts={self.converts}, convert_time={self.convert_time!r}, last_change={self.last_change!r})'
+        )
+
+
+class KnobSnapshot(Mapping):
+    """
+    Immutable view of the registered knob values at the time Knob.snapshot() was taken,
+    accessible by key and by attribute
+    >>> snapshot = Knob.snapshot()
+    >>> snapshot['JOLLY_ROGER_PIRATES'] == snapshot.JOLLY_ROGER_PIRATES
+    True
+    """
+
+    __slots__ = ('_entries', '_values')
+
+    def __init__(self, entries):
+        """
+        :param entries: env name -> (knob, environment string, value)
+        """
+        object.__setattr__(self, '_entries', entries)
+        object.__setattr__(self, '_values', {name: entry[2] for name, entry in entries.items()})
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._values!r})'
@@ -0,0 +1,83 @@
+"""
+asyncio delivery of knob changes, see Knob.changed(), Knob.changes() and Knob.registry_changes()
+"""
+import asyncio
+
+from knobs import Knob
+
+_CLOSED = object()
+
+
+class KnobSubscription:
+    """
+    Changes of one knob, or of every registered knob, delivered to the running event loop.
+
+    Changes may come from any thread: they are handed to the loop with call_soon_threadsafe and
+    queued per subscription, so the notifier never blocks and a slow subscriber never holds up
+    the others. A bounded subscription drops its oldest change when full.
+
+    >>> with KnobSubscription(pirates) as subscription:
+    ...     async for knob in subscription:
+    ...         print(knob.get())
+    """
+
+    def __init__(self, knob=None, maxsize=0):
+        """
+        :param knob: knob to follow, None for the whole registry
+        :param maxsize: changes queued before the oldest is dropped, 0 for unbounded
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+        self._listeners = knob._listener_list() if knob is not None else Knob._registry_listeners
+        self._listeners.append(self._notify)
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+        knob = await self.get()
+        if knob is _CLOSED:
+            raise StopAsyncIteration
+        return knob
+
+    async def get(self):
+        """
+        Wait for the next change
+        :return: the changed knob
+        """
+        return await self._queue.get()
+
+    def close(self):
+        """ Unsubscribe, a pending iteration stops """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._listeners.remove(self._notify)
+        except ValueError:
+            pass
+        try:
+            self._loop.call_soon_threadsafe(self._put, _CLOSED)
+        except RuntimeError:
+            # the loop is closed already
+            pass
+
+    def _notify(self, knob):
+        try:
+            self._loop.call_soon_threadsafe(self._put, knob)
+        except RuntimeError:
+            self.close()
+
+    def _put(self, knob):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(knob)
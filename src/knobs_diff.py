@@ -0,0 +1,174 @@
+"""
+Diff and merge of env files and the knob registry. Every side is a sequence of (key, value) sorted
+by key, which are compared in a single merge pass, so nothing but the sides themselves is held.
+
+    $ knobs-diff deploy/.env .env
+    $ knobs-diff -m myapp.settings :defaults .env --merge .env.merged
+
+A side is an env file, ':defaults' for the defaults of the registered knobs or ':current' for
+their current values.
+"""
+import importlib
+import json
+
+import click
+
+from environment import dotenv_cache, flatten_and_write
+from knobs import Knob
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+DEFAULTED = 'defaulted'
+UNCHANGED = 'unchanged'
+
+
+def env_file_items(dotenv_path, resolve=False):
+    """
+    :param dotenv_path: env file
+    :param resolve: resolve ${VAR} references, by default values are compared as written
+    :return: iterator of (key, value) sorted by key
+    """
+    values = dotenv_cache.values(dotenv_path) if resolve else dotenv_cache.raw(dotenv_path)
+    return iter(sorted(values.items()))
+
+
+def registry_items(current=False, prefix=''):
+    """
+    :param current: current values instead of defaults
+    :param prefix: only knobs whose name starts with prefix
+    :return: iterator of (name, value string) of the registered knobs, sorted by name. Knobs without
+             a value, a None default, are left out
+    """
+    for name, knob in Knob.iter_knobs(prefix):
+        value = knob.get() if current else knob.default
+        if value is not None:
+            yield name, str(value)
+
+
+def diff(old, new, defaults=None):
+    """
+    Compare two sequences of (key, value) sorted by key
+    >>> list(diff([('A', '1'), ('B', '2')], [('B', '3'), ('C', '4')]))
+    [('removed', 'A', '1', None), ('changed', 'B', '2', '3'), ('added', 'C', None, '4')]
+
+    :param old: iterable of (key, value) sorted by key
+    :param new: iterable of (key, value) sorted by key
+    :param defaults: callable returning the default string of a key or None, keys removed from new
+                     that have a default are DEFAULTED instead of REMOVED. Defaults to the registry
+    :return: iterator of (status, key, old value, new value), unchanged keys included as UNCHANGED
+    """
+    if defaults is None:
+        defaults = _registered_default
+    old, new = iter(old), iter(new)
+    old_item, new_item = next(old, None), next(new, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            key, value = old_item
+            default = defaults(key)
+            if default is None:
+                yield REMOVED, key, value, None
+            else:
+                yield DEFAULTED, key, value, default
+            old_item = next(old, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield ADDED, new_item[0], None, new_item[1]
+            new_item = next(new, None)
+        else:
+            key, old_value = old_item
+            new_value = new_item[1]
+            yield UNCHANGED if old_value == new_value else CHANGED, key, old_value, new_value
+            old_item, new_item = next(old, None), next(new, None)
+
+
+def merge(old, new, keep_removed=True):
+    """
+    Merge two sequences of (key, value) sorted by key, new values win
+    :param old: iterable of (key, value) sorted by key
+    :param new: iterable of (key, value) sorted by key
+    :param keep_removed: keep keys only old has
+    :return: iterator of (key, value) sorted by key
+    """
+    for status, key, old_value, new_value in diff(old, new, defaults=_no_default):
+        if status != REMOVED:
+            yield key, new_value
+        elif keep_removed:
+            yield key, old_value
+
+
+def write_merged(dotenv_path, old, new, keep_removed=True, quote_mode='always'):
+    """
+    Merge two sorted sequences into an env file with a single atomic write
+    :param dotenv_path: env file written
+    :param old: iterable of (key, value) sorted by key
+    :param new: iterable of (key, value) sorted by key
+    :param keep_removed: keep keys only old has
+    :param quote_mode: 'always' or 'auto'
+    """
+    flatten_and_write(dotenv_path, merge(old, new, keep_removed), quote_mode)
+
+
+def _registered_default(key):
+    knob = Knob.get_registered_knob(key)
+    return None if knob is None or knob.default is None else str(knob.default)
+
+
+def _no_default(key):
+    return None
+
+
+def _side(name, resolve):
+    if name == ':defaults':
+        return registry_items()
+    if name == ':current':
+        return registry_items(current=True)
+    return env_file_items(name, resolve)
+
+
+_MARKS = {ADDED: '+', REMOVED: '-', CHANGED: '~', DEFAULTED: '=', UNCHANGED: ' '}
+
+
+@click.command()
+@click.argument('old')
+@click.argument('new')
+@click.option('-m', '--module', 'modules', multiple=True, help='Import a module registering knobs, repeatable.')
+@click.option('--resolve', is_flag=True, help='Compare values with ${VAR} references resolved.')
+@click.option('--all', 'show_all', is_flag=True, help='Also list unchanged keys.')
+@click.option('--format', 'fmt', type=click.Choice(['text', 'jsonl']), default='text', help='Output format.')
+@click.option('--merge', 'merge_path', help='Write NEW merged over OLD to this env file.')
+@click.option('--drop-removed', is_flag=True, help='Leave keys only OLD has out of the merged file.')
+@click.pass_context
+def main(ctx, old, new, modules, resolve, show_all, fmt, merge_path, drop_removed):
+    """
+    Diff env files and the knob registry, exits 1 when they differ.
+
+    OLD and NEW are env files, ':defaults' for the defaults of the registered knobs or ':current' for
+    their current values. Keys are listed as + added, - removed, ~ changed, or = defaulted when a
+    registered knob falls back to its default. Env files are loaded in full.
+    """
+    for module in modules:
+        importlib.import_module(module)
+
+    # collected once, the merge may overwrite OLD or NEW and ':current' is read a single time
+    old_items, new_items = list(_side(old, resolve)), list(_side(new, resolve))
+
+    differences = False
+    for status, key, old_value, new_value in diff(old_items, new_items):
+        if status != UNCHANGED:
+            differences = True
+        elif not show_all:
+            continue
+        if fmt == 'jsonl':
+            click.echo(json.dumps({'status': status, 'key': key, 'old': old_value, 'new': new_value}))
+        elif status in (CHANGED, DEFAULTED):
+            click.echo(f'{_MARKS[status]} {key}={old_value} -> {new_value}')
+        else:
+            click.echo(f'{_MARKS[status]} {key}={new_value if old_value is None else old_value}')
+
+    if merge_path:
+        write_merged(merge_path, old_items, new_items, keep_removed=not drop_removed)
+    ctx.exit(1 if differences else 0)
+
+
+if __name__ == '__main__':
+    main()
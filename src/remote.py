@@ -0,0 +1,402 @@
+"""
+Knob values held by a config service. A RemoteSource fetches the names of all registered knobs in
+batches through a backend and keeps them for a ttl, so knobs read it like any other source.
+
+    >>> chain = SourceChain([
+    ...     RemoteSource(HttpBackend('http://config:8080/knobs'), ttl=30, stale=300),
+    ...     DotenvSource('.env'),
+    ... ])
+    >>> knobs.use_sources(chain)
+
+A backend is any object with fetch(names) returning a dict of the names it holds to strings.
+"""
+import http.client
+import http.server
+import json
+import queue
+import threading
+import time
+import urllib.parse
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from knobs import Knob
+from sources import to_environ_string
+
+# monotonic clock the ttl is measured on
+_clock = time.monotonic
+
+
+class RemoteError(OSError):
+    pass
+
+
+class HttpBackend:
+    """
+    A config service speaking json over HTTP: a POST of {"keys": [names]} is answered with a json
+    object of the names it holds. Connections are kept alive and reused from a pool, a pooled
+    connection the server has closed in the meantime is replaced once.
+    """
+
+    def __init__(self, url, pool_size=4, timeout=5.0, headers=None):
+        """
+        :param url: http or https url of the service
+        :param pool_size: idle connections kept open
+        :param timeout: socket timeout in seconds
+        :param headers: extra request headers, like Authorization
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported url '{url}'")
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', 'Accept': 'application/json', **(headers or {})}
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._netloc = parts.netloc
+        self._path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self._pool = queue.LifoQueue(pool_size)
+
+    def fetch(self, names):
+        """
+        :param names: variable names
+        :return: dict of the names the service holds -> string
+        """
+        body = json.dumps({'keys': list(names)}).encode('utf-8')
+        try:
+            connection, reused = self._pool.get_nowait(), True
+        except queue.Empty:
+            connection, reused = self._connect(), False
+
+        try:
+            try:
+                response = self._request(connection, body)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # the server closed the idle connection
+                connection.close()
+                connection = self._connect()
+                response = self._request(connection, body)
+            data = response.read()
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self._pool.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+        if response.status != 200:
+            raise RemoteError(f'{self.url} answered {response.status} {response.reason}')
+        values = json.loads(data)
+        return {name: to_environ_string(value) for name, value in values.items() if value is not None}
+
+    def close(self):
+        """ Close the pooled connections """
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _connect(self):
+        return self._connection_class(self._netloc, timeout=self.timeout)
+
+    def _request(self, connection, body):
+        connection.request('POST', self._path, body, self.headers)
+        return connection.getresponse()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.url!r})'
+
+
+class RedisBackend:
+    """
+    Keys of a redis server read with one MGET, through a client like redis.Redis that pools its own
+    connections
+    >>> RedisBackend(redis.Redis(host='config'), prefix='myapp:')
+    """
+
+    def __init__(self, client, prefix=''):
+        """
+        :param client: redis client
+        :param prefix: prefix of the redis keys, the variable names follow it
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def fetch(self, names):
+        names = list(names)
+        values = self.client.mget([self.prefix + name for name in names])
+        return {
+            name: value.decode('utf-8') if isinstance(value, bytes) else to_environ_string(value)
+            for name, value in zip(names, values) if value is not None
+        }
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.client!r}, prefix={self.prefix!r})'
+
+
+class RemoteSource:
+    """
+    Values of a backend for the registered knobs. The first lookup fetches the names of all registered
+    knobs at once, split in batches of batch_size fetched in parallel, a name looked up later is fetched
+    on its first lookup. Values are fresh for ttl seconds and then served stale for up to stale more
+    seconds while a background thread fetches them again, past that a lookup waits for the fetch.
+    Knobs of values that changed on a fetch are notified. A failed fetch warns and serves the values
+    held so far, none before the first success, for another ttl before it is tried again.
+    """
+
+    def __init__(self, backend, ttl=30.0, stale=300.0, batch_size=500, workers=4):
+        """
+        :param backend: object with fetch(names) returning a dict of the names it holds -> string
+        :param ttl: seconds values are fresh
+        :param stale: seconds stale values are served while they are fetched again
+        :param batch_size: names per fetch
+        :param workers: batches fetched in parallel
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.stale = stale
+        self.batch_size = batch_size
+        self.workers = workers
+        self._values = None
+        # names fetched, held by the backend or not
+        self._names = frozenset()
+        self._fresh_until = 0.0
+        self._stale_until = 0.0
+        self._refresh_thread = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """
+        Call callback(source, names) with the names whose value changed on a fetch, instead of notifying
+        their knobs. A SourceChain subscribes to patch its index.
+        :param callback: function
+        """
+        self._subscribers.append(callback)
+
+    def values(self):
+        """
+        :return: dict of name -> string, fetched again once stale
+        """
+        values = self._values
+        if values is not None:
+            now = _clock()
+            if now < self._fresh_until:
+                return values
+            if now < self._stale_until:
+                self._revalidate()
+                return values
+
+        changed = []
+        with self._lock:
+            if self._values is None or _clock() >= self._stale_until:
+                names = self._wanted()
+                try:
+                    fetched = self._fetch(names)
+                except Exception as e:
+                    self._fetch_failed(names, e)
+                else:
+                    changed = self._apply(names, fetched, everything=True)
+            values = self._values
+        self._notify(changed)
+        return values
+
+    def keys(self):
+        return self.values().keys()
+
+    def get(self, name):
+        """
+        :param name: variable name
+        :return: string, None if the backend doesn't hold name
+        """
+        values = self.values()
+        if name not in self._names:
+            changed = []
+            with self._lock:
+                if name not in self._names:
+                    # knobs registered since the last fetch come along
+                    names = self._wanted((name, )) - self._names
+                    try:
+                        fetched = self._fetch(names)
+                    except Exception as e:
+                        self._fetch_failed(names, e)
+                    else:
+                        changed = self._apply(names, fetched)
+                values = self._values
+            self._notify(changed)
+        return values.get(name)
+
+    def reload(self):
+        """ Expire the values, the next lookup fetches them again """
+        with self._lock:
+            self._fresh_until = self._stale_until = 0.0
+
+    def wait(self, timeout=None):
+        """
+        Wait for a background fetch, if one is running
+        :param timeout: seconds
+        """
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _wanted(self, extra=()):
+        names = set(self._names)
+        names.update(name for name, _ in Knob.iter_knobs())
+        names.update(extra)
+        return names
+
+    def _fetch(self, names):
+        names = sorted(names)
+        batches = [names[i:i + self.batch_size] for i in range(0, len(names), self.batch_size)]
+        if len(batches) < 2:
+            return self.backend.fetch(names) if names else {}
+        values = {}
+        with ThreadPoolExecutor(min(self.workers, len(batches))) as executor:
+            for fetched in executor.map(self.backend.fetch, batches):
+                values.update(fetched)
+        return values
+
+    def _apply(self, names, fetched, everything=False):
+        """
+        Swap in fetched values, called holding the lock
+        :param names: names fetched
+        :param fetched: dict the backend returned
+        :param everything: names are all the names, start a new ttl
+        :return: names whose value changed, none on the first fetch
+        """
+        old = self._values
+        if everything:
+            values = fetched
+            changed_names = set(names).union(old or ())
+            self._names = frozenset(names)
+            self._fresh_until = _clock() + self.ttl
+            self._stale_until = self._fresh_until + self.stale
+        else:
+            values = dict(old)
+            for name in names:
+                values.pop(name, None)
+            values.update(fetched)
+            changed_names = names
+            self._names = self._names.union(names)
+        self._values = values
+        if old is None:
+            return []
+        return sorted(name for name in changed_names if old.get(name) != values.get(name))
+
+    def _fetch_failed(self, names, error):
+        """
+        A lookup's fetch failed, called holding the lock. The names count as fetched and the values held
+        are served for another ttl, lookups don't wait on a backend that is down
+        """
+        warnings.warn(f'Fetching knobs from {self.backend!r} failed, serving the values held: {error}')
+        if self._values is None:
+            self._values = {}
+        self._names = self._names.union(names)
+        self._fresh_until = _clock() + self.ttl
+        self._stale_until = max(self._stale_until, self._fresh_until)
+
+    def _revalidate(self):
+        with self._lock:
+            if self._refresh_thread is None:
+                self._refresh_thread = threading.Thread(target=self._refresh, name='knobs-remote', daemon=True)
+                self._refresh_thread.start()
+
+    def _refresh(self):
+        changed = []
+        try:
+            names = self._wanted()
+            fetched = self._fetch(names)
+        except Exception as e:
+            warnings.warn(f'Fetching knobs from {self.backend!r} failed, serving stale values: {e}')
+            with self._lock:
+                # try again after a ttl, but not past the stale values
+                self._fresh_until = min(_clock() + self.ttl, self._stale_until)
+                self._refresh_thread = None
+            return
+        with self._lock:
+            changed = self._apply(names, fetched, everything=True)
+            self._refresh_thread = None
+        self._notify(changed)
+
+    def _notify(self, names):
+        if not names:
+            return
+        if self._subscribers:
+            for callback in self._subscribers:
+                callback(self, names)
+        else:
+            Knob.notify_changed(names)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.backend!r}, ttl={self.ttl}, stale={self.stale})'
+
+
+class LocalConfigServer:
+    """
+    An in-process config service speaking the protocol of HttpBackend, for tests and benchmarks
+    >>> with LocalConfigServer({'PIRATES': '124'}) as server:
+    ...     HttpBackend(server.url).fetch(['PIRATES'])
+    {'PIRATES': '124'}
+    """
+
+    def __init__(self, values=None, latency=0.0):
+        """
+        :param values: dict served, changed in place to change what is served
+        :param latency: seconds each request is delayed
+        """
+        self.values = {} if values is None else values
+        self.latency = latency
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written apart, don't hold the body back for the client's ack
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                if self.path != '/knobs':
+                    self.send_error(404)
+                    return
+                names = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['keys']
+                server.requests.append((self.client_address, names))
+                if server.latency:
+                    time.sleep(server.latency)
+                body = json.dumps({name: server.values[name] for name in names if name in server.values}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}/knobs'
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='knobs-config-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
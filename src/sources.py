@@ -0,0 +1,287 @@
+"""
+Configuration sources layered behind os.environ. A SourceChain merges its sources into one name
+index, the first source holding a name wins, and knobs consult it for variables that aren't set
+in the environment. Nothing is copied into os.environ.
+
+    >>> chain = SourceChain([
+    ...     DotenvSource('.env.local'),
+    ...     DotenvSource('.env'),
+    ...     JsonSource('config.json'),
+    ...     SecretsSource('/run/secrets'),
+    ... ])
+    >>> knobs.use_sources(chain)
+
+Each source is read on first lookup and then only again when reloaded.
+"""
+import json
+import os
+import threading
+
+from environment import dotenv_cache
+from knobs import Knob
+
+
+class Source:
+    """
+    A read once mapping of variable names to strings. Subclasses implement _read(), a missing file
+    or directory is an empty source.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: file or directory read by the source
+        """
+        self.path = os.path.abspath(path)
+        self._values = None
+        self._lock = threading.Lock()
+
+    def values(self):
+        """
+        :return: dict of name -> string, read on first use
+        """
+        values = self._values
+        if values is None:
+            with self._lock:
+                if self._values is None:
+                    self._values = self._read() if os.path.exists(self.path) else {}
+                values = self._values
+        return values
+
+    def keys(self):
+        return self.values().keys()
+
+    def get(self, name):
+        """
+        :param name: variable name
+        :return: string, None if the source doesn't hold name
+        """
+        return self.values().get(name)
+
+    def reload(self):
+        """ Forget what was read, the next lookup reads the source again """
+        with self._lock:
+            self._values = None
+
+    def _read(self):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r})'
+
+
+class DotenvSource(Source):
+    """ A .env file, ${VAR} references are resolved """
+
+    def _read(self):
+        dotenv_cache.invalidate(self.path)
+        return dict(dotenv_cache.values(self.path))
+
+
+class _MappingFileSource(Source):
+    """ A file holding a mapping, optionally below a dotted section like 'tool.pirates' """
+
+    def __init__(self, path, section=None):
+        """
+        :param path: file
+        :param section: dotted path of the table holding the variables, None for the top level
+        """
+        super().__init__(path)
+        self.section = section
+
+    def _read(self):
+        data = self._load()
+        if self.section:
+            for part in self.section.split('.'):
+                data = data.get(part, {})
+        return {name: to_environ_string(value) for name, value in data.items() if value is not None}
+
+    def _load(self):
+        raise NotImplementedError
+
+
+class JsonSource(_MappingFileSource):
+    """ A json object, values that aren't strings are converted with to_environ_string() """
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+class TomlSource(_MappingFileSource):
+    """ A toml file, read with tomllib or on Python before 3.11 with tomli """
+
+    def _load(self):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError('TomlSource needs Python 3.11 or the tomli package') from None
+        with open(self.path, 'rb') as f:
+            return tomllib.load(f)
+
+
+class SecretsSource(Source):
+    """
+    A directory holding a file per secret, like /run/secrets. The directory is listed once and
+    a secret file is only read on its first lookup, a trailing newline is stripped.
+    """
+
+    def _read(self):
+        return {entry.name: None for entry in os.scandir(self.path) if entry.is_file() and entry.name[0] != '.'}
+
+    def get(self, name):
+        values = self.values()
+        value = values.get(name)
+        if value is None and name in values:
+            with open(os.path.join(self.path, name), encoding='utf-8') as f:
+                value = f.read()
+            if value.endswith('\n'):
+                value = value[:-2] if value.endswith('\r\n') else value[:-1]
+            values[name] = value
+        return value
+
+
+def to_environ_string(value):
+    """
+    The environment string knobs read for a structured value, booleans as 'true' or 'false',
+    lists and tables as json
+    >>> to_environ_string([1, 2])
+    '[1, 2]'
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+class SourceChain:
+    """
+    Sources layered by precedence, the first source holding a name wins. A merged index maps every
+    name to its winning source, built on the first lookup and patched by reload(). Sources that learn
+    names later, like remote.RemoteSource, are asked before the indexed source of a name they outrank
+    and for names missing from the index, and patch it when their values change.
+    """
+
+    def __init__(self, sources):
+        """
+        :param sources: sources, highest precedence first
+        """
+        self.sources = list(sources)
+        self._index = None
+        # reentrant, a subscribed source may notify while it is read to build the index
+        self._lock = threading.RLock()
+        self._open_sources = [source for source in self.sources if hasattr(source, 'subscribe')]
+        for source in self._open_sources:
+            source.subscribe(self._source_changed)
+        # id of a source -> the open sources above it, they may hold names they haven't fetched yet
+        self._outranking = {}
+        above = ()
+        for source in self.sources:
+            self._outranking[id(source)] = above
+            if hasattr(source, 'subscribe'):
+                above += (source, )
+
+    def _build_index(self):
+        with self._lock:
+            if self._index is None:
+                index = {}
+                # lowest precedence first, higher sources overwrite
+                for source in reversed(self.sources):
+                    index.update(dict.fromkeys(source.keys(), source))
+                self._index = index
+            return self._index
+
+    def get(self, name):
+        """
+        :param name: variable name
+        :return: string of the winning source, None if no source holds name
+        """
+        index = self._index
+        if index is None:
+            index = self._build_index()
+        source = index.get(name)
+        if source is not None:
+            for open_source in self._outranking[id(source)]:
+                value = open_source.get(name)
+                if value is not None:
+                    return value
+            return source.get(name)
+        for source in self._open_sources:
+            value = source.get(name)
+            if value is not None:
+                return value
+        return None
+
+    def source_of(self, name):
+        """
+        :param name: variable name
+        :return: the source name is read from, None if no source holds it
+        """
+        index = self._index
+        if index is None:
+            index = self._build_index()
+        return index.get(name)
+
+    def keys(self):
+        index = self._index
+        if index is None:
+            index = self._build_index()
+        return index.keys()
+
+    def reload(self, source=None):
+        """
+        Read a source, or all, again and tell the knobs of names whose value changed
+        :param source: source of the chain, None for all
+        :return: list of changed names
+        """
+        sources = self.sources if source is None else [source]
+        if self._index is None:
+            for reloaded in sources:
+                reloaded.reload()
+            return []
+
+        names = set()
+        for reloaded in sources:
+            names.update(reloaded.keys())
+        before = {name: self.get(name) for name in names}
+
+        for reloaded in sources:
+            reloaded.reload()
+            names.update(reloaded.keys())
+        # new names were read from a source that wasn't reloaded, if any, the index isn't patched yet
+        for name in names.difference(before):
+            before[name] = self.get(name)
+
+        with self._lock:
+            self._patch_index(self._index, names)
+
+        changed = sorted(name for name in names if self.get(name) != before.get(name))
+        Knob.notify_changed(changed)
+        return changed
+
+    def _patch_index(self, index, names):
+        for name in names:
+            winner = next((s for s in self.sources if name in s.keys()), None)
+            if winner is None:
+                index.pop(name, None)
+            else:
+                index[name] = winner
+
+    def _source_changed(self, source, names):
+        """ Patch the index for names whose value changed in a subscribed source, notify those it wins """
+        with self._lock:
+            index = self._index
+            if index is None:
+                return
+            won = {name for name in names if index.get(name) is source}
+            self._patch_index(index, names)
+            won.update(name for name in names if index.get(name) is source)
+        Knob.notify_changed(sorted(won))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.sources!r})'
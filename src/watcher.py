@@ -0,0 +1,237 @@
+"""
+Hot reload of a .env file into the environment of a long running process
+"""
+import ctypes
+import ctypes.util
+import functools
+import os
+import select
+import threading
+import warnings
+
+from environment import InterpolationError, dotenv_values
+from knobs import Knob
+
+# inotify(7) event masks
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class DotenvWatcher:
+    """
+    Watches a .env file from a background thread and applies changed keys to the environment.
+
+    Only keys the file still owns are touched: a key is updated or removed when the environment
+    holds the value the file had before, nothing at all or a default written by Knob.get(),
+    so variables set by the real environment or with Knob.set() win. Knobs of changed keys are
+    invalidated and their on_change callbacks are called from the watcher thread.
+
+    Changes are picked up with inotify on Linux and by polling the file's stat elsewhere. inotify
+    watches the directory of the path and of the file it resolves to, and any event there is checked
+    against the file's stat, so renames over the file and symlink swaps like a Kubernetes ConfigMap
+    update are seen too.
+
+    >>> watcher = DotenvWatcher('.env', interval=2).start()
+    >>> watcher.stop()
+    """
+
+    def __init__(self, dotenv_path, interval=1.0, use_inotify=True):
+        """
+        :param dotenv_path: env file to watch
+        :param interval: seconds between polls
+        :param use_inotify: use inotify where available
+        """
+        self.dotenv_path = os.path.abspath(dotenv_path)
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self._values = {}
+        self._signature = None
+        self._stop = threading.Event()
+        self._wakeup = None
+        self._thread = None
+        # directories watched with inotify
+        self._watched = set()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """
+        Load the file, variables already set are kept, and start watching it
+        :return: self
+        """
+        # watch before reading, a change in between is then seen by the thread
+        fd = _inotify_init() if self.use_inotify else None
+        self._watched = set()
+        if fd is not None and not self._watch_dirs(fd):
+            os.close(fd)
+            fd = None
+
+        self._signature = self._stat()
+        self._values = self._read()
+        for k, v in self._values.items():
+            if self._owns(k, None):
+                os.environ[k] = v
+
+        self._stop.clear()
+        if fd is not None:
+            self._wakeup = os.pipe()
+        self._thread = threading.Thread(
+            target=self._run, args=(fd, ), name=f'DotenvWatcher({self.dotenv_path})', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop watching, waits for the watcher thread to finish """
+        self._stop.set()
+        if self._wakeup is not None:
+            os.write(self._wakeup[1], b'\0')
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._wakeup is not None:
+            for wakeup_fd in self._wakeup:
+                os.close(wakeup_fd)
+            self._wakeup = None
+
+    def check(self):
+        """
+        Reload the file if its stat changed
+        :return: list of changed keys
+        """
+        signature = self._stat()
+        if signature == self._signature:
+            return []
+        self._signature = signature
+        return self.reload()
+
+    def reload(self):
+        """
+        Read the file and apply the keys that changed since the last read
+        :return: list of changed keys
+        """
+        try:
+            values = self._read()
+        except (OSError, InterpolationError) as e:
+            warnings.warn(f'Not reloading {self.dotenv_path}, {e}')
+            return []
+
+        previous, self._values = self._values, values
+        changed = []
+        for k, v in values.items():
+            old = previous.get(k)
+            if v != old and self._owns(k, old):
+                os.environ[k] = v
+                changed.append(k)
+        for k, old in previous.items():
+            if k not in values and os.environ.get(k) == old:
+                del os.environ[k]
+                changed.append(k)
+
+        Knob.notify_changed(changed)
+        return changed
+
+    @staticmethod
+    def _owns(name, old):
+        """
+        The file may set name: the environment holds what the file had before, nothing, or the default a knob wrote
+        :param name: variable name
+        :param old: value the file had, None if it didn't have name
+        """
+        current = os.environ.get(name)
+        return current is None or current == old or Knob.written_default(name) is not None
+
+    def _read(self):
+        if not os.path.exists(self.dotenv_path):
+            return {}
+        return dotenv_values(self.dotenv_path)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.dotenv_path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _run(self, fd):
+        if fd is None:
+            while not self._stop.wait(self.interval):
+                self._check_in_thread()
+            return
+
+        try:
+            while not self._stop.is_set():
+                readable, _, _ = select.select([fd, self._wakeup[0]], [], [])
+                if fd in readable:
+                    # the event names don't tell a symlink swap on the path apart, the stat does
+                    os.read(fd, 64 * 1024)
+                    self._check_in_thread()
+                    # a swapped symlink may now point to another directory
+                    self._watch_dirs(fd)
+        finally:
+            os.close(fd)
+
+    def _watch_dirs(self, fd):
+        """
+        Watch the directory of the path and of the file it resolves to, watching a directory catches
+        files replaced by rename
+        :return: False if a directory can't be watched
+        """
+        ok = True
+        for dirname in {os.path.dirname(self.dotenv_path), os.path.dirname(os.path.realpath(self.dotenv_path))}:
+            if dirname not in self._watched:
+                if _inotify_add_watch(fd, dirname):
+                    self._watched.add(dirname)
+                else:
+                    ok = False
+        return ok
+
+    def _check_in_thread(self):
+        try:
+            self.check()
+        except Exception as e:
+            # a failing callback must not end the watch
+            warnings.warn(f'Reloading {self.dotenv_path} failed, {e!r}')
+
+
+@functools.lru_cache(maxsize=None)
+def _libc():
+    """ libc with the inotify functions, None where inotify is not available """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+def _inotify_init():
+    """
+    :return: inotify file descriptor, None where inotify is not available
+    """
+    libc = _libc()
+    if libc is None:
+        return None
+    fd = libc.inotify_init1(IN_CLOEXEC)
+    return fd if fd >= 0 else None
+
+
+def _inotify_add_watch(fd, dirname):
+    """
+    :param fd: inotify file descriptor
+    :param dirname: directory to watch
+    :return: success flag
+    """
+    return _libc().inotify_add_watch(fd, os.fsencode(dirname), _WATCH_MASK) >= 0
@@ -1,6 +1,20 @@
+import abc
+import datetime
+import io
+import marshal
+import multiprocessing
 import os
+import pathlib
+import threading
+import time
 
-from knobs import Knob
+import click
+import pytest
+from click.testing import CliRunner
+
+import knobs
+from environment import load_dotenv, parse_dotenv
+from knobs import Knob, ListKnob
 
 
 def test_repr():
@@ -80,3 +94,515 @@ def test_set():
 
     setknob.set('XX123')
     assert setknob.get() == 'XX123'
+
+
+def test_cache_follows_environment():
+    calls = []
+
+    def validator(value):
+        calls.append(value)
+        return value
+
+    knob = Knob('CACHED_KNOB', 1, validator=validator, cache=True)
+    os.environ['CACHED_KNOB'] = '5'
+    assert knob.get() == 5
+    assert knob.get() == 5
+    assert calls == [5]
+
+    os.environ['CACHED_KNOB'] = '6'
+    assert knob.get() == 6
+    assert calls == [5, 6]
+    knob.rm()
+
+
+def test_cache_invalidate():
+    calls = []
+
+    def validator(value):
+        calls.append(value)
+        return value
+
+    knob = Knob('CACHED_KNOB', 1, validator=validator, cache=True)
+    knob.set(7)
+    assert knob.get() == 7
+    knob.invalidate()
+    assert knob.get() == 7
+    Knob.invalidate_registry()
+    assert knob.get() == 7
+    assert calls == [7, 7, 7]
+    knob.rm()
+
+
+def test_list_knob():
+    knob = ListKnob('JSON_LIST', ['Foo', 'bar'])
+    assert knob.get() == ['Foo', 'bar']
+    assert os.environ['JSON_LIST'] == '["Foo", "bar"]'
+    knob.set('["DEAD", "BEEF"]')
+    assert knob.get() == ['DEAD', 'BEEF']
+    assert knob.get_type() == list
+    knob.rm()
+
+
+def test_list_knob_cache_is_frozen():
+    knob = ListKnob('JSON_LIST', ['Foo'], cache=True)
+    assert knob.get() == ('Foo',)
+
+    os.environ['JSON_LIST'] = '[["shard1", "host1"], {"shard2": ["host2"]}]'
+    value = knob.get()
+    assert value[0] == ('shard1', 'host1')
+    assert value[1]['shard2'] == ('host2',)
+    with pytest.raises(TypeError):
+        value[1]['shard2'] = ()
+    assert knob.get() is value
+
+    os.environ['JSON_LIST'] = '["other"]'
+    assert knob.get() == ('other',)
+    knob.rm()
+
+
+def test_dotenv_loaded_on_first_get(tmpdir, monkeypatch):
+    tmpdir.join('.env').write('LAZY_KNOB=42\n')
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.delenv('LAZY_KNOB', raising=False)
+    monkeypatch.setattr(knobs, '_dotenv_loaded', False)
+
+    knob = Knob('LAZY_KNOB', 1)
+    assert 'LAZY_KNOB' not in os.environ
+    assert knob.get() == 42
+    knob.rm()
+
+
+def test_dotenv_autoload_waits_for_the_load(tmpdir, monkeypatch):
+    tmpdir.join('.env').write('LAZY_KNOB=42\n')
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.delenv('LAZY_KNOB', raising=False)
+    monkeypatch.setattr(knobs, '_dotenv_loaded', False)
+    loading = threading.Event()
+
+    def slow_load_dotenv(*args, **kwargs):
+        loading.set()
+        time.sleep(0.1)
+        return load_dotenv(*args, **kwargs)
+
+    monkeypatch.setattr(knobs, 'load_dotenv', slow_load_dotenv)
+    knob = Knob('LAZY_KNOB', 1)
+    values = []
+    first = threading.Thread(target=lambda: values.append(knob.get()))
+    first.start()
+    loading.wait()
+    # a second reader while the first one loads .env doesn't write the default ahead of it
+    values.append(knob.get())
+    first.join()
+    assert values == [42, 42]
+    knob.rm()
+
+
+def test_dotenv_autoload_disabled(tmpdir, monkeypatch):
+    tmpdir.join('.env').write('LAZY_KNOB=42\n')
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.delenv('LAZY_KNOB', raising=False)
+    monkeypatch.setenv('KNOBS_NO_AUTOLOAD', '1')
+    monkeypatch.setattr(knobs, '_dotenv_loaded', False)
+
+    knob = Knob('LAZY_KNOB', 1)
+    assert knob.get() == 1
+    knob.rm()
+
+    assert knobs.load_env()
+    assert knob.get() == 42
+    knob.rm()
+
+
+def test_snapshot(monkeypatch):
+    Knob.clear_registry()
+    monkeypatch.setenv('SNAP_PIRATES', '125')
+    monkeypatch.delenv('SNAP_PARROTS', raising=False)
+    calls = []
+
+    def validator(value):
+        calls.append(value)
+        return value
+
+    Knob('SNAP_PIRATES', 124, validator=validator)
+    Knob('SNAP_PARROTS', 2)
+
+    snapshot = Knob.snapshot()
+    assert snapshot.SNAP_PIRATES == 125
+    assert snapshot['SNAP_PARROTS'] == 2
+    assert dict(snapshot) == {'SNAP_PIRATES': 125, 'SNAP_PARROTS': 2}
+    with pytest.raises(AttributeError):
+        snapshot.SNAP_PIRATES = 1
+    with pytest.raises(AttributeError):
+        snapshot.MISSING
+
+    # unchanged values are reused, changed ones resolved again
+    os.environ['SNAP_PIRATES'] = '126'
+    assert snapshot.SNAP_PIRATES == 125
+    assert Knob.snapshot().SNAP_PIRATES == 126
+    assert Knob.snapshot().SNAP_PIRATES == 126
+    assert calls == [125, 126]
+    Knob.clear_registry()
+
+
+def test_snapshot_values_frozen(monkeypatch):
+    Knob.clear_registry()
+    monkeypatch.setenv('SNAP_SHIPS', '["Revenge", {"guns": [40]}]')
+    ListKnob('SNAP_SHIPS', [])
+
+    snapshot = Knob.snapshot()
+    assert snapshot.SNAP_SHIPS == ('Revenge', {'guns': (40, )})
+    with pytest.raises(TypeError):
+        snapshot.SNAP_SHIPS[1]['guns'] = ()
+    assert Knob.snapshot().SNAP_SHIPS is snapshot.SNAP_SHIPS
+    Knob.clear_registry()
+
+
+def test_no_write_default(monkeypatch):
+    monkeypatch.delenv('READ_ONLY_KNOB', raising=False)
+    knob = Knob('READ_ONLY_KNOB', 124, write_default=False)
+    assert knob.get() == 124
+    assert 'READ_ONLY_KNOB' not in os.environ
+
+    monkeypatch.setattr(Knob, 'write_default', False)
+    list_knob = ListKnob('READ_ONLY_KNOB', ['Foo'], cache=True)
+    assert list_knob.get() == ('Foo', )
+    assert list_knob.get() is list_knob.get()
+    assert 'READ_ONLY_KNOB' not in os.environ
+
+
+def test_concurrent_registration(monkeypatch):
+    Knob.clear_registry()
+    monkeypatch.setattr(Knob, 'write_default', False)
+
+    def register(offset):
+        for i in range(200):
+            Knob(f'THREADED_{offset}_{i}', i)
+            if i % 20 == 0:
+                Knob.snapshot()
+
+    threads = [threading.Thread(target=register, args=(offset, )) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(Knob.snapshot()) == 8 * 200
+    Knob.clear_registry()
+
+
+def test_write_knobs(monkeypatch):
+    Knob.clear_registry()
+    monkeypatch.setenv('RENDER_PIRATES', '125')
+    Knob('RENDER_PIRATES', 124, description='Yar')
+    Knob('RENDER_PARROTS', 2, description='Squawk')
+    Knob('OTHER', 'x')
+
+    def render(*args, **kwargs):
+        out = io.StringIO()
+        Knob.write_knobs(out, *args, **kwargs)
+        return out.getvalue()
+
+    assert render('table', prefix='RENDER_') == (
+        'Knob            Description  Default\n'
+        '--------------  -----------  -------\n'
+        'RENDER_PARROTS  Squawk       2\n'
+        'RENDER_PIRATES  Yar          124\n'
+    )
+    assert render('jsonl', current=True, pattern='*PIRATES') == (
+        '{"Knob": "RENDER_PIRATES", "Description": "Yar", "Value": 125}\n'
+    )
+    assert render('csv', prefix='RENDER_') == (
+        'Knob,Description,Default\r\nRENDER_PARROTS,Squawk,2\r\nRENDER_PIRATES,Yar,124\r\n'
+    )
+    assert render('dotenv', current=True, prefix='RENDER_') == (
+        '# Squawk\nRENDER_PARROTS="2"\n\n# Yar\nRENDER_PIRATES="125"\n'
+    )
+    assert render('fancy_grid') == Knob.get_knob_defaults_as_table() + '\n'
+    assert render('fancy_grid', current=True) == Knob.get_knobs_current_as_table() + '\n'
+    with pytest.raises(ValueError):
+        render('yaml')
+    Knob.clear_registry()
+
+
+def test_write_knobs_dotenv_reads_back(monkeypatch, tmpdir):
+    Knob.clear_registry()
+    values = {
+        'DUMP_WORDS': 'two words # not a comment',
+        'DUMP_QUOTES': 'say "yo" \'ho\'',
+        'DUMP_PATH': 'C:\\temp\\new',
+        'DUMP_SHIPS': '["Revenge", "Fancy"]',
+    }
+    for name, value in values.items():
+        monkeypatch.setenv(name, value)
+    Knob('DUMP_WORDS', '')
+    Knob('DUMP_QUOTES', '')
+    Knob('DUMP_PATH', '')
+    ListKnob('DUMP_SHIPS', [])
+
+    dotenv = tmpdir.join('.env')
+    with open(str(dotenv), 'w') as f:
+        Knob.write_knobs(f, 'dotenv', current=True)
+    assert dict(parse_dotenv(str(dotenv))) == values
+    Knob.clear_registry()
+
+
+def test_print_knobs_env():
+    Knob.clear_registry()
+    Knob('PRINT_PIRATES', 124, description='Yar')
+
+    @click.command()
+    @click.option('--knobs', is_flag=True, callback=Knob.print_knobs_env, expose_value=False, is_eager=True)
+    def cli():
+        pass
+
+    result = CliRunner().invoke(cli, ['--knobs'])
+    assert result.output == '# Yar\n# PRINT_PIRATES=124\n\n'
+    Knob.clear_registry()
+
+
+def test_knob_stats(monkeypatch):
+    Knob.clear_registry()
+    Knob.reset_stats()
+    monkeypatch.setenv('STATS_PIRATES', '125')
+    monkeypatch.setenv('STATS_SHIPS', '["Revenge"]')
+    pirates = Knob('STATS_PIRATES', 124, cache=True)
+    assert pirates.get() == 125
+    Knob.enable_stats()
+    try:
+        ships = ListKnob('STATS_SHIPS', [])
+        for _ in range(3):
+            pirates.get()
+        ships.get()
+        assert pirates.get() == 125
+        monkeypatch.setenv('STATS_PIRATES', '126')
+        assert pirates.get() == 126
+    finally:
+        Knob.disable_stats()
+    pirates.get()
+
+    stats = Knob.read_stats()
+    assert stats['STATS_PIRATES'].reads == 5
+    assert (stats['STATS_PIRATES'].hits, stats['STATS_PIRATES'].misses) == (4, 1)
+    assert stats['STATS_PIRATES'].converts == 1
+    assert stats['STATS_PIRATES'].last_change is not None
+    assert stats['STATS_SHIPS'].last_change is None
+    assert [name for name, _ in Knob.hot_knobs(1)] == ['STATS_PIRATES']
+
+    out = io.StringIO()
+    Knob.write_hot_knobs(out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].split() == ['Knob', 'Reads', 'Hits', 'Misses', 'Cast', 'ms', 'Last', 'change']
+    assert lines[2].split()[:4] == ['STATS_PIRATES', '5', '4', '1']
+    assert lines[3].split()[:4] == ['STATS_SHIPS', '1', '0', '0']
+
+    Knob.reset_stats()
+    assert Knob.read_stats() == {}
+    Knob.clear_registry()
+
+
+def test_print_hot_knobs(monkeypatch):
+    Knob.clear_registry()
+    Knob.reset_stats()
+    monkeypatch.setenv('HOT_PIRATES', '125')
+    pirates = Knob('HOT_PIRATES', 124)
+
+    @click.command()
+    @click.option('--hot-knobs', is_flag=True, callback=Knob.print_hot_knobs, expose_value=False, is_eager=True)
+    def cli():
+        pirates.get()
+
+    try:
+        result = CliRunner().invoke(cli, ['--hot-knobs'])
+    finally:
+        Knob.disable_stats()
+    assert result.output.splitlines()[2].split()[:2] == ['HOT_PIRATES', '1']
+    Knob.reset_stats()
+    Knob.clear_registry()
+
+
+def test_slotted_knob(monkeypatch):
+    monkeypatch.delenv('SLOTTED_KNOB', raising=False)
+    knob = Knob('SLOTTED_KNOB', 124)
+    assert not hasattr(knob, '__dict__')
+    with pytest.raises(AttributeError):
+        knob.pirates = 124
+
+    # write_default follows the class unless given to the knob
+    monkeypatch.setattr(Knob, 'write_default', False)
+    knob = Knob('SLOTTED_KNOB', 124, write_default=True)
+    assert knob.get() == 124
+    assert os.environ['SLOTTED_KNOB'] == '124'
+    knob.rm()
+
+    # knobs with the same settings share them, settings with a validator are the knob's own
+    shared = [Knob(f'SLOTTED_{i}', i, unit='ms') for i in range(2)]
+    assert shared[0]._meta is shared[1]._meta
+    shared[1].unit = 's'
+    assert (shared[0].unit, shared[1].unit) == ('ms', 's')
+    shared[1].validator = abs
+    assert shared[1].validator is abs
+    assert Knob('SLOTTED_2', 2, validator=abs)._meta is not shared[1]._meta
+    metas = len(knobs._knob_metas)
+    for i in range(100):
+        Knob(f'SLOTTED_VALIDATED_{i}', i, validator=lambda value: value)
+    assert len(knobs._knob_metas) == metas
+    Knob.clear_registry()
+    assert not knobs._knob_metas
+
+    class Crewed(abc.ABC):
+        @abc.abstractmethod
+        def crew(self):
+            pass
+
+    class PirateKnob(Knob, Crewed):
+        def crew(self):
+            return 'Yar'
+
+    pirates = PirateKnob('SLOTTED_PIRATES', 124)
+    pirates.ship = 'Revenge'
+    assert isinstance(pirates, Crewed)
+    assert pirates.get() == 124
+    assert 'SLOTTED_PIRATES' not in os.environ
+
+
+def test_namespace(monkeypatch):
+    Knob.clear_registry()
+    monkeypatch.setenv('DB_PORT', '5433')
+    Knob('DB_PORT', 5432)
+    Knob('CACHE_TTL', 60)
+    Knob('DB_HOST', 'localhost')
+    Knob('DB', 'postgres')
+    Knob('DB_HOST', 'localhost')
+
+    assert [name for name, _ in Knob.by_prefix('DB_')] == ['DB_HOST', 'DB_PORT']
+    assert [name for name, _ in Knob.by_prefix('')] == ['CACHE_TTL', 'DB', 'DB_HOST', 'DB_PORT']
+    assert Knob.by_prefix('TENANT_') == []
+
+    db = Knob.namespace('DB_')
+    assert len(db) == 2
+    assert db['DB_PORT'] is Knob.get_registered_knob('DB_PORT')
+    with pytest.raises(KeyError):
+        db['CACHE_TTL']
+    assert db.resolve() == {'DB_HOST': 'localhost', 'DB_PORT': 5433}
+
+    Knob('DB_USER', 'root')
+    assert list(db) == ['DB_HOST', 'DB_PORT', 'DB_USER']
+
+    db.reset()
+    assert 'DB_PORT' not in os.environ
+    monkeypatch.setattr(Knob, 'write_default', False)
+    assert db.resolve() == {'DB_HOST': 'localhost', 'DB_PORT': 5432, 'DB_USER': 'root'}
+    Knob.clear_registry()
+
+
+def test_knob_kinds(monkeypatch):
+    monkeypatch.setenv('KIND_TIMEOUT', '1m30s')
+    monkeypatch.setenv('KIND_BUFFER', '4KiB')
+    monkeypatch.setenv('KIND_RATIO', '0.5')
+    timeout = Knob('KIND_TIMEOUT', datetime.timedelta(seconds=10))
+    assert timeout.get() == datetime.timedelta(seconds=90)
+    assert Knob('KIND_BUFFER', 1024, kind='size').get() == 4096
+    assert Knob('KIND_RATIO', 1.0).get() == 0.5
+
+    # what set() writes reads back
+    timeout.set(datetime.timedelta(minutes=2))
+    assert timeout.get() == datetime.timedelta(minutes=2)
+
+    with pytest.raises(ValueError):
+        Knob('KIND_UNKNOWN', 1, kind='parsecs')
+
+
+def test_knob_kind_sets_type(monkeypatch):
+    monkeypatch.setenv('KIND_INT', '5')
+    monkeypatch.setenv('KIND_TIMEOUT', '90')
+    # a type without a registered converter casts itself, not the default's type
+    count = Knob('KIND_INT', '1', kind=int)
+    assert count.get() == 5
+    assert count.get_type() is int
+
+    timeout = Knob('KIND_TIMEOUT', 30, kind='duration')
+    assert timeout.get_type() is datetime.timedelta
+    assert timeout.get() == datetime.timedelta(seconds=90)
+    assert Knob('KIND_BUFFER', 1024, kind='size').get_type() is int
+    assert Knob('KIND_PATH', '/tmp', kind='path').get_type() is pathlib.Path
+    assert Knob('KIND_SHIPS', ['Revenge'], kind='json').get_type() is list
+
+
+def test_knob_cast_failure(monkeypatch, capsys):
+    monkeypatch.setenv('BROKEN_PIRATES', 'many')
+    with pytest.raises(SystemExit):
+        Knob('BROKEN_PIRATES', 124).get()
+    assert "Environment name 'BROKEN_PIRATES' failed with 'many'" in capsys.readouterr().err
+
+
+def read_export_pirates(_):
+    return Knob('EXPORT_PIRATES', 0).get(), knobs._dotenv_loaded, 'EXPORT_PIRATES' in os.environ
+
+
+def test_export_knobs(monkeypatch):
+    Knob.clear_registry()
+    monkeypatch.setattr(Knob, 'write_default', False)
+    monkeypatch.setattr(knobs, '_dotenv_loaded', True)
+    monkeypatch.delenv('EXPORT_PIRATES', raising=False)
+    # read from a source, not the environment the workers inherit
+    monkeypatch.setattr(knobs, '_sources', knobs.ExportedKnobs({'EXPORT_PIRATES': '125'}))
+    Knob('EXPORT_PIRATES', 124)
+
+    with multiprocessing.get_context('spawn').Pool(2, *knobs.pool_initializer()) as pool:
+        assert pool.map(read_export_pirates, range(2)) == [(125, True, False)] * 2
+
+    monkeypatch.setattr(knobs, '_sources', None)
+    monkeypatch.setattr(knobs, '_dotenv_loaded', False)
+    knobs.install_knobs(marshal.dumps({'EXPORT_PIRATES': '126'}))
+    assert knobs._dotenv_loaded
+    assert Knob.get_registered_knob('EXPORT_PIRATES').get() == 126
+    Knob.clear_registry()
+
+
+def test_knob_config(monkeypatch):
+    monkeypatch.setenv('CONFIG_PORT', '5433')
+    monkeypatch.delenv('CONFIG_HOST', raising=False)
+    monkeypatch.delenv('CONFIG_LAG', raising=False)
+    calls = []
+
+    def validator(value):
+        calls.append(value)
+        return value
+
+    class Database(knobs.KnobConfig):
+        __slots__ = ()
+        host = Knob('CONFIG_HOST', 'localhost')
+        port = Knob('CONFIG_PORT', 5432, validator=validator)
+
+    class Replica(Database):
+        __slots__ = ()
+        lag = Knob('CONFIG_LAG', 1.5)
+
+    replica = Replica.resolve()
+    assert not hasattr(replica, '__dict__')
+    assert (replica.host, replica.port, replica.lag) == ('localhost', 5433, 1.5)
+    assert isinstance(replica, Database)
+    assert Replica.port.env_name == 'CONFIG_PORT'
+    assert repr(replica) == "Replica(host='localhost', port=5433, lag=1.5)"
+    with pytest.raises(AttributeError):
+        replica.port = 1
+
+    # only changed fields are resolved again, written defaults are no change
+    assert replica.refresh() == []
+    monkeypatch.setenv('CONFIG_PORT', '5434')
+    assert replica.refresh() == ['port']
+    assert replica.port == 5434
+    assert calls == [5433, 5434]
+    assert Database.resolve().port == 5434
+
+    class Mixin:
+        pass
+
+    with pytest.raises(TypeError, match='Unslotted'):
+
+        class Unslotted(Database):
+            pass
+
+    with pytest.raises(TypeError, match='Mixin'):
+
+        class Mixed(Database, Mixin):
+            __slots__ = ()
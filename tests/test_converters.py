@@ -0,0 +1,117 @@
+import datetime
+import decimal
+import enum
+import pathlib
+
+import pytest
+
+from converters import converter_type, get_converter, parse_duration, parse_size, register_converter
+
+
+class Colour(enum.Enum):
+    RED = 'red'
+    GREEN = 'green'
+
+
+class Level(enum.IntEnum):
+    LOW = 1
+    HIGH = 2
+
+
+def test_builtin_kinds():
+    assert get_converter(bool, bool)('Yes') is True
+    assert get_converter(bool, bool)('no') is False
+    assert get_converter(int, int)('42') == 42
+    assert get_converter(float, float)('2.5') == 2.5
+    assert get_converter(tuple, tuple)('A B') == ('A', 'B')
+    assert get_converter('json', list)('["A", 1]') == ['A', 1]
+    assert get_converter(decimal.Decimal, decimal.Decimal)('0.10') == decimal.Decimal('0.10')
+    assert get_converter(pathlib.PosixPath, pathlib.PosixPath)('~/rum') == pathlib.Path.home() / 'rum'
+    assert get_converter('path', str)('/tmp') == pathlib.Path('/tmp')
+    assert get_converter(str, str) is str
+
+    with pytest.raises(ValueError):
+        get_converter(decimal.Decimal, decimal.Decimal)('lots')
+    with pytest.raises(ValueError):
+        get_converter('yaml', str)
+
+
+def test_enum():
+    colour = get_converter(Colour, Colour)
+    assert colour('RED') is Colour.RED
+    assert colour('green') is Colour.GREEN
+    assert colour(str(Colour.GREEN)) is Colour.GREEN
+    with pytest.raises(ValueError):
+        colour('blue')
+
+    level = get_converter(Level, Level)
+    assert level('2') is Level.HIGH
+    assert level('LOW') is Level.LOW
+
+
+@pytest.mark.parametrize(
+    'value, seconds', [
+        ('30', 30),
+        ('1.5', 1.5),
+        ('250ms', 0.25),
+        ('1h30m', 5400),
+        ('1m 30s', 90),
+        ('2d', 172800),
+        ('-5s', -5),
+        (str(datetime.timedelta(days=1, seconds=5.5)), 86405.5),
+        (str(datetime.timedelta(minutes=3)), 180),
+    ]
+)
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == datetime.timedelta(seconds=seconds)
+
+
+@pytest.mark.parametrize('value', ['', 'soon', '5 parsecs', '1h foo', 'h'])
+def test_parse_duration_invalid(value):
+    with pytest.raises(ValueError):
+        parse_duration(value)
+
+
+@pytest.mark.parametrize(
+    'value, size', [
+        ('512', 512),
+        ('10MB', 10**7),
+        ('64k', 64000),
+        ('2KiB', 2048),
+        ('1.5GiB', 3 * 2**29),
+        ('123456789012345678901', 123456789012345678901),
+    ]
+)
+def test_parse_size(value, size):
+    assert parse_size(value) == size
+
+
+@pytest.mark.parametrize('value', ['', 'big', '10 XB', '-1'])
+def test_parse_size_invalid(value):
+    with pytest.raises(ValueError):
+        parse_size(value)
+
+
+def test_register_converter():
+
+    @register_converter('test_csv')
+    def csv_converter(cast):
+        return lambda value: [item.strip() for item in value.split(',')]
+
+    assert get_converter('test_csv', list)('a, b') == ['a', 'b']
+
+
+def test_unregistered_callable_kind():
+    assert get_converter(int, str)('5') == 5
+    assert get_converter(ord, str)('a') == 97
+    with pytest.raises(ValueError):
+        get_converter(5, int)
+
+
+def test_converter_type():
+    assert converter_type(int, str) is int
+    assert converter_type('duration', int) is datetime.timedelta
+    assert converter_type('size', float) is int
+    assert converter_type('path', str) is pathlib.Path
+    assert converter_type('path', pathlib.PosixPath) is pathlib.PosixPath
+    assert converter_type('json', dict) is dict
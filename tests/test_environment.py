@@ -2,10 +2,15 @@
 
 import os
 import warnings
+from collections import OrderedDict
 
 import pytest
 
-from environment import find_dotenv, load_dotenv
+import environment
+from environment import (
+    DotenvCache, DotenvEditor, DotenvIndex, InterpolationError, clear_find_dotenvs_cache, dotenv_values, find_dotenv,
+    find_dotenvs, get_key, load_dotenv, parse_dotenv, resolve_nested_variables, set_key, unset_key
+)
 
 try:
     from tempfile import TemporaryDirectory
@@ -21,7 +26,7 @@ def dotenv_file(tmpdir):
         return str(file_)
 
 
-def test_find_dotenv():
+def test_find_dotenv(monkeypatch):
     """
     Create a temporary folder structure like the following:
         tmpXiWxa5/
@@ -45,7 +50,7 @@ def test_find_dotenv():
         child1, child4 = dirs[0], dirs[-1]
 
         # change the working directory for testing
-        os.chdir(child4)
+        monkeypatch.chdir(child4)
         #
         # try without a .env file and force error
         with pytest.raises(IOError):
@@ -68,3 +73,374 @@ def test_warns_if_file_does_not_exist():
         assert len(w) == 1
         assert w[0].category is UserWarning
         assert str(w[0].message) == "Not loading .does_not_exist, it doesn't exist."
+
+
+def test_find_dotenvs(tmpdir, monkeypatch):
+    child = tmpdir.mkdir('child1').mkdir('child2')
+    monkeypatch.chdir(child)
+    filenames = ('.env.local', '.env')
+
+    assert find_dotenvs(filenames, usecwd=True) == []
+    with pytest.raises(IOError):
+        find_dotenvs(filenames, raise_error_if_not_found=True, usecwd=True)
+
+    tmpdir.join('.env').write('')
+    child.join('.env').write('')
+    tmpdir.join('child1', '.env.local').write('')
+    assert find_dotenvs(filenames, usecwd=True) == [
+        str(tmpdir.join('child1', '.env.local')),
+        str(child.join('.env')),
+        str(tmpdir.join('.env')),
+    ]
+
+    child.join('.env').remove()
+    assert find_dotenvs(filenames, usecwd=True) == [
+        str(tmpdir.join('child1', '.env.local')),
+        str(tmpdir.join('.env')),
+    ]
+
+
+def test_find_dotenvs_max_age(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    clear_find_dotenvs_cache()
+    assert find_dotenvs(usecwd=True, max_age=60) == []
+
+    # trusted without looking at the file system
+    tmpdir.join('.env').write('')
+    assert find_dotenvs(usecwd=True, max_age=60) == []
+    assert find_dotenvs(usecwd=True) == [str(tmpdir.join('.env'))]
+
+    clear_find_dotenvs_cache()
+    assert find_dotenvs(usecwd=True, max_age=60) == [str(tmpdir.join('.env'))]
+
+
+def test_find_dotenvs_max_age_not_extended_by_hits(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    clear_find_dotenvs_cache()
+    now = [1000.0]
+    monkeypatch.setattr(environment.time, 'monotonic', lambda: now[0])
+    assert find_dotenvs(usecwd=True, max_age=60) == []
+
+    tmpdir.join('.env').write('')
+    # polled more often than max_age, still revalidated once max_age passed since the last check
+    for _ in range(3):
+        now[0] += 30
+        found = find_dotenvs(usecwd=True, max_age=60)
+    assert found == [str(tmpdir.join('.env'))]
+
+
+def test_parse_dotenv(tmpdir):
+    dotenv = tmpdir.join('.env')
+    dotenv.write(
+        '# comment\n'
+        'PLAIN=value\n'
+        '  SPACED = two words  \n'
+        'export EXPORTED=1\n'
+        'INLINE=value # comment\n'
+        'HASH=a#b\n'
+        'QUOTED="quoted # not a comment" # comment\n'
+        "SINGLE='single'\n"
+        'ESCAPED="tab\\there"\n'
+        'MULTILINE="line1\n'
+        'line2"\n'
+        'EMPTY=\n'
+        'no equals sign\n'
+        "SINGLE_COMMENT='single' # comment\n"
+        'TAB_COMMENT=value\t# comment\n'
+        'UNICODE="\u00e9\u20ac\\t"\n'
+        '=no name\n'
+    )
+    assert list(parse_dotenv(str(dotenv))) == [
+        ('PLAIN', 'value'),
+        ('SPACED', 'two words'),
+        ('EXPORTED', '1'),
+        ('INLINE', 'value'),
+        ('HASH', 'a#b'),
+        ('QUOTED', 'quoted # not a comment'),
+        ('SINGLE', 'single'),
+        ('ESCAPED', 'tab\there'),
+        ('MULTILINE', 'line1\nline2'),
+        ('EMPTY', ''),
+        ('SINGLE_COMMENT', 'single'),
+        ('TAB_COMMENT', 'value'),
+        ('UNICODE', '\u00e9\u20ac\t'),
+    ]
+
+
+def test_dotenv_editor(tmpdir):
+    dotenv = tmpdir.join('.env')
+    dotenv.write('# pirates\nPIRATES=124\n\n# parrots\nPARROTS="2"\nSHIPS=1')
+
+    with DotenvEditor(str(dotenv)) as editor:
+        assert editor['PARROTS'] == '2'
+        editor.set('PIRATES', 125)
+        assert editor.unset('PARROTS')
+        assert not editor.unset('MISSING')
+        editor.set('RUM', 'yes please')
+        assert 'RUM' in editor
+        # nothing written before the block exits
+        assert dotenv.read().startswith('# pirates\nPIRATES=124\n')
+
+    assert dotenv.read() == '# pirates\nPIRATES="125"\n\n# parrots\nSHIPS=1\nRUM="yes please"\n'
+    assert list(parse_dotenv(str(dotenv))) == [('PIRATES', '125'), ('SHIPS', '1'), ('RUM', 'yes please')]
+
+    # written escaped, read back as set
+    with DotenvEditor(str(dotenv)) as editor:
+        editor.set('PATH', 'C:\\new\\"rum" ahoy')
+    assert dotenv_values(str(dotenv))['PATH'] == 'C:\\new\\"rum" ahoy'
+    set_key(str(dotenv), 'RUM', 'C:\\tmp')
+    assert dotenv_values(str(dotenv))['PATH'] == 'C:\\new\\"rum" ahoy'
+    assert dotenv_values(str(dotenv))['RUM'] == 'C:\\tmp'
+
+
+def test_dotenv_editor_appends_without_trailing_newline(tmpdir):
+    dotenv = tmpdir.join('.env')
+    dotenv.write('# pirates\nA=1')
+    with DotenvEditor(str(dotenv)) as editor:
+        editor.set('B', 2)
+        editor.set('A', 3)
+    assert dotenv.read() == '# pirates\nA="3"\nB="2"\n'
+
+    dotenv.write('# pirates')
+    with DotenvEditor(str(dotenv)) as editor:
+        editor.set('B', 2)
+    assert dotenv.read() == '# pirates\nB="2"\n'
+
+
+def test_dotenv_editor_discards_on_error(tmpdir):
+    dotenv = tmpdir.join('.env')
+    dotenv.write('PIRATES=124\n')
+
+    with pytest.raises(RuntimeError):
+        with DotenvEditor(str(dotenv)) as editor:
+            editor.set('PIRATES', 0)
+            raise RuntimeError()
+
+    assert dotenv.read() == 'PIRATES=124\n'
+    assert tmpdir.listdir() == [dotenv]
+
+
+def test_dotenv_editor_keeps_symlink_and_mode(tmpdir):
+    target = tmpdir.mkdir('config').join('.env')
+    target.write('PIRATES=124\n')
+    target.chmod(0o640)
+    link = tmpdir.join('.env')
+    link.mksymlinkto(target)
+
+    with DotenvEditor(str(link)) as editor:
+        editor.set('PIRATES', 125)
+
+    assert link.islink()
+    assert target.read() == 'PIRATES="125"\n'
+    assert oct(target.stat().mode & 0o777) == oct(0o640)
+    assert get_key(str(link), 'PIRATES') == '125'
+    assert tmpdir.join('config').listdir() == [target]
+
+
+def test_resolve_nested_variables(monkeypatch):
+    monkeypatch.setenv('FROM_ENVIRON', 'environ')
+    monkeypatch.delenv('UNSET', raising=False)
+    monkeypatch.delenv('SELF', raising=False)
+    values = OrderedDict([
+        ('URL', 'http://${HOST}:${PORT}/'),
+        ('HOST', '${DOMAIN}'),
+        ('DOMAIN', 'example.com'),
+        ('PORT', '${UNSET:-8080}'),
+        ('ENVIRON', '${FROM_ENVIRON}'),
+        ('SELF', '${SELF}:/opt/bin'),
+        ('PLAIN', 'no references'),
+    ])
+    assert resolve_nested_variables(values) == OrderedDict([
+        ('URL', 'http://example.com:8080/'),
+        ('HOST', 'example.com'),
+        ('DOMAIN', 'example.com'),
+        ('PORT', '8080'),
+        ('ENVIRON', 'environ'),
+        ('SELF', ':/opt/bin'),
+        ('PLAIN', 'no references'),
+    ])
+
+
+def test_resolve_nested_variables_errors(monkeypatch):
+    monkeypatch.delenv('UNSET', raising=False)
+    with pytest.raises(InterpolationError, match='A -> B -> C -> A'):
+        resolve_nested_variables({'A': '${B}', 'B': '${C}', 'C': '${A}'})
+
+    with pytest.raises(InterpolationError, match='NEEDED: UNSET must be set'):
+        resolve_nested_variables({'NEEDED': '${UNSET:?must be set}'})
+
+
+def test_dotenv_cache(tmpdir, monkeypatch):
+    monkeypatch.setenv('CACHE_HOST', 'localhost')
+    dotenv = tmpdir.join('.env')
+    dotenv.write('URL=http://${CACHE_HOST}/\nPORT=80\n')
+    path = str(dotenv)
+    cache = DotenvCache()
+
+    values = cache.values(path)
+    assert values == OrderedDict([('URL', 'http://localhost/'), ('PORT', '80')])
+    assert cache.values(path) is values
+
+    # the environment a value refers to changed
+    monkeypatch.setenv('CACHE_HOST', 'example.com')
+    assert cache.values(path)['URL'] == 'http://example.com/'
+
+    dotenv.write('PORT=8080\n')
+    assert cache.values(path) == OrderedDict([('PORT', '8080')])
+
+
+def test_persistent_dotenv_cache(tmpdir, monkeypatch):
+    monkeypatch.setenv('CACHE_HOST', 'localhost')
+    dotenv = tmpdir.join('.env')
+    dotenv.write('URL=http://${CACHE_HOST}/\nPORT=80\n')
+    path = str(dotenv)
+    cache_dir = str(tmpdir.join('cache'))
+    expected = OrderedDict([('URL', 'http://localhost/'), ('PORT', '80')])
+    assert DotenvCache(cache_dir=cache_dir).values(path) == expected
+
+    # a new process reads the file from the cache without parsing it
+    def parse_dotenv(dotenv_path):
+        raise AssertionError('parsed')
+
+    with monkeypatch.context() as m:
+        m.setattr(environment, 'parse_dotenv', parse_dotenv)
+        m.setattr(environment, 'resolve_nested_variables', parse_dotenv)
+        assert DotenvCache(cache_dir=cache_dir).values(path) == expected
+
+    # the environment a value refers to changed
+    monkeypatch.setenv('CACHE_HOST', 'example.com')
+    assert DotenvCache(cache_dir=cache_dir).values(path)['URL'] == 'http://example.com/'
+
+    dotenv.write('PORT=8080\n')
+    assert DotenvCache(cache_dir=cache_dir).values(path) == OrderedDict([('PORT', '8080')])
+
+    # corrupt entries fall back to parsing
+    for name in os.listdir(cache_dir):
+        with open(os.path.join(cache_dir, name), 'wb') as f:
+            f.write(b'\xff\x00 yar')
+    assert DotenvCache(cache_dir=cache_dir).values(path) == OrderedDict([('PORT', '8080')])
+    for content in (b'[1, 2]', b'{"PORT": "80"}', b'[[3, "/", 0, 0, ""], 5, null, []]'):
+        for name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, name), 'wb') as f:
+                f.write(content)
+        assert DotenvCache(cache_dir=cache_dir).values(path) == OrderedDict([('PORT', '8080')])
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='posix permissions')
+def test_persistent_caches_skip_shared_directories(tmpdir, monkeypatch):
+    dotenv = tmpdir.join('.env')
+    dotenv.write('A=1\nB=${A}2\n')
+    path = str(dotenv)
+    cache_dir = tmpdir.join('cache')
+    assert DotenvCache(cache_dir=str(cache_dir)).values(path)['B'] == '12'
+    assert DotenvIndex(cache_dir=str(cache_dir)).get(path, 'B') == '12'
+    assert (cache_dir.stat().mode & 0o777) == 0o700
+
+    # anyone could have planted the entries of a directory others can write to
+    cache_dir.chmod(0o777)
+    parsed = []
+    monkeypatch.setattr(environment, 'parse_dotenv', lambda dotenv_path: parsed.append(dotenv_path) or [('B', '3')])
+    built = []
+    build = environment._SpanIndex.build
+    monkeypatch.setattr(environment._SpanIndex, 'build', lambda f, signature: built.append(f) or build(f, signature))
+    assert DotenvCache(cache_dir=str(cache_dir)).values(path)['B'] == '3'
+    assert DotenvIndex(cache_dir=str(cache_dir)).get(path, 'B') == '12'
+    assert parsed and built
+
+
+def test_dotenv_cache_eviction(tmpdir):
+    cache = DotenvCache(maxsize=2)
+    paths = []
+    for i in range(3):
+        dotenv = tmpdir.join(f'{i}.env')
+        dotenv.write(f'KEY={i}\n')
+        paths.append(str(dotenv))
+        cache.raw(paths[-1])
+    assert list(cache._entries) == paths[1:]
+
+    cache.invalidate(paths[1])
+    assert list(cache._entries) == paths[2:]
+
+
+def test_key_functions_use_cache(tmpdir):
+    dotenv = tmpdir.join('.env')
+    dotenv.write('PIRATES=124\n')
+    path = str(dotenv)
+
+    assert get_key(path, 'PIRATES') == '124'
+    set_key(path, 'PIRATES', 125)
+    assert get_key(path, 'PIRATES') == '125'
+    unset_key(path, 'PIRATES')
+    assert get_key(path, 'PIRATES') is None
+
+
+def test_dotenv_index(tmpdir, monkeypatch):
+    monkeypatch.setenv('INDEX_HOST', 'localhost')
+    monkeypatch.delenv('INDEX_UNSET', raising=False)
+    dotenv = tmpdir.join('.env')
+    dotenv.write_binary(
+        'NAME="Ærø"\r\n'
+        'PORT=80\n'
+        'MULTI="first\nPORT=1\nlast"\n'
+        '# PORT=2\n'
+        'export URL=http://${INDEX_HOST}:${PORT}/${NAME}  # comment\n'
+        'NESTED=${URL}?${INDEX_UNSET:-x}\n'
+        'PATH=${PATH}:/opt\n'
+        'PORT=8080\n'.encode('utf-8')
+    )
+    path = str(dotenv)
+    index = DotenvIndex()
+    for key, value in dotenv_values(path).items():
+        assert index.get(path, key) == value
+    assert index.get(path, 'NESTED') == 'http://localhost:8080/Ærø?x'
+    assert index.get(path, 'MISSING') is None
+
+
+@pytest.mark.parametrize('newline', ['\r\n', '\r'])
+def test_dotenv_index_newlines(tmpdir, newline):
+    dotenv = tmpdir.join('.env')
+    lines = ['NAME="Ærø"', 'MULTI="first', 'second"', 'RAW=value # comment', 'NESTED=${MULTI}/${RAW}', 'LAST=1']
+    dotenv.write_binary(newline.join(lines).encode('utf-8'))
+    path = str(dotenv)
+    values = dotenv_values(path)
+    assert values['MULTI'] == 'first\nsecond'
+    for cache_dir in (None, str(tmpdir.join('cache'))):
+        index = DotenvIndex(cache_dir=cache_dir)
+        assert {key: index.get(path, key) for key in values} == values
+        assert DotenvIndex(cache_dir=cache_dir).get(path, 'NESTED') == 'first\nsecond/value'
+
+
+def test_persistent_dotenv_index(tmpdir, monkeypatch):
+    dotenv = tmpdir.join('.env')
+    dotenv.write('A=1\nB=${A}2\n')
+    path = str(dotenv)
+    cache_dir = str(tmpdir.join('cache'))
+    assert DotenvIndex(cache_dir=cache_dir).get(path, 'B') == '12'
+
+    def build(f, signature):
+        raise AssertionError('indexed')
+
+    # a new process probes the on-disk table
+    with monkeypatch.context() as m:
+        m.setattr(environment._SpanIndex, 'build', build)
+        assert DotenvIndex(cache_dir=cache_dir).get(path, 'B') == '12'
+        assert DotenvIndex(cache_dir=cache_dir).get(path, 'C') is None
+
+    # same size and mtime, the entry read no longer matches
+    st = os.stat(path)
+    dotenv.write('B=9\nA=8\n')
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert DotenvIndex(cache_dir=cache_dir).get(path, 'B') == '9'
+
+
+def test_dotenv_index_table_collisions(tmpdir):
+    dotenv = tmpdir.join('.env')
+    dotenv.write(''.join(f'KEY_{i}=value {i}\n' for i in range(500)))
+    path = str(dotenv)
+    cache_dir = str(tmpdir.join('cache'))
+    DotenvIndex(cache_dir=cache_dir).get(path, 'KEY_0')
+
+    index = DotenvIndex(cache_dir=cache_dir)
+    assert all(index.get(path, f'KEY_{i}') == f'value {i}' for i in range(500))
+    assert index.get(path, 'KEY_500') is None
+    assert isinstance(index._indexes[os.path.abspath(path)], environment._SpanTable)
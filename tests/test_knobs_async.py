@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+from knobs import Knob
+from knobs_async import KnobSubscription
+
+
+def test_changed():
+    pirates = Knob('ASYNC_PIRATES', 124)
+
+    async def main():
+        waiters = [asyncio.ensure_future(pirates.changed()) for _ in range(3)]
+        await asyncio.sleep(0)
+        threading.Thread(target=pirates.set, args=(125, )).start()
+        return await asyncio.wait_for(asyncio.gather(*waiters), 5)
+
+    assert asyncio.run(main()) == [125, 125, 125]
+    assert pirates._listeners == []
+    pirates.rm()
+
+
+def test_changes():
+    pirates = Knob('ASYNC_PIRATES', 124)
+
+    async def main():
+        values = []
+        changes = pirates.changes()
+        pending = asyncio.ensure_future(changes.__anext__())
+        await asyncio.sleep(0)
+        pirates.set(125)
+        values.append(await asyncio.wait_for(pending, 5))
+        pirates.set(126)
+        values.append(await asyncio.wait_for(changes.__anext__(), 5))
+        await changes.aclose()
+        return values
+
+    assert asyncio.run(main()) == [125, 126]
+    assert pirates._listeners == []
+    pirates.rm()
+
+
+def test_registry_subscription():
+    pirates = Knob('ASYNC_PIRATES', 124)
+    parrots = Knob('ASYNC_PARROTS', 2)
+
+    async def main():
+        with KnobSubscription(maxsize=2) as subscription:
+            pirates.set(125)
+            parrots.set(3)
+            pirates.rm()
+            await asyncio.sleep(0)
+            # the oldest change was dropped
+            changed = [await subscription.get(), await subscription.get()]
+        assert [knob async for knob in subscription] == []
+        return changed
+
+    assert asyncio.run(main()) == [parrots, pirates]
+    assert Knob._registry_listeners == []
+    parrots.rm()
@@ -0,0 +1,118 @@
+import json
+import os
+
+from click.testing import CliRunner
+
+import knobs_diff
+from environment import dotenv_cache
+from knobs import Knob
+from knobs_diff import ADDED, CHANGED, DEFAULTED, REMOVED, UNCHANGED, diff, merge, registry_items, write_merged
+
+
+def test_diff_statuses():
+    old = [('A', '1'), ('B', '2'), ('D', '5')]
+    new = [('B', '3'), ('C', '4'), ('D', '5')]
+    assert list(diff(old, new, defaults=lambda key: None)) == [
+        (REMOVED, 'A', '1', None),
+        (CHANGED, 'B', '2', '3'),
+        (ADDED, 'C', None, '4'),
+        (UNCHANGED, 'D', '5', '5'),
+    ]
+
+
+def test_diff_defaulted_by_registry():
+    Knob('DIFF_PARROTS', 2)
+    assert list(diff([('DIFF_PARROTS', '5'), ('DIFF_RUM', '1')], [])) == [
+        (DEFAULTED, 'DIFF_PARROTS', '5', '2'),
+        (REMOVED, 'DIFF_RUM', '1', None),
+    ]
+
+
+def test_diff_consumes_iterators():
+    old = iter([('A', '1')])
+    new = (item for item in [('A', '1'), ('B', '2')])
+    assert [status for status, *_ in diff(old, new)] == [UNCHANGED, ADDED]
+
+
+def test_registry_items(monkeypatch):
+    monkeypatch.setenv('DIFF_SHIPS', '7')
+    Knob('DIFF_SHIPS', 3)
+    assert list(registry_items(prefix='DIFF_SHIPS')) == [('DIFF_SHIPS', '3')]
+    assert list(registry_items(current=True, prefix='DIFF_SHIPS')) == [('DIFF_SHIPS', '7')]
+
+    # no default, nothing to compare
+    monkeypatch.delenv('DIFF_NONE', raising=False)
+    Knob('DIFF_NONE', None, write_default=False)
+    assert list(registry_items(prefix='DIFF_NONE')) == []
+    assert list(registry_items(current=True, prefix='DIFF_NONE')) == []
+    assert list(diff([('DIFF_NONE', 'x')], [])) == [(REMOVED, 'DIFF_NONE', 'x', None)]
+
+
+def test_merge():
+    old = [('A', '1'), ('B', '2')]
+    new = [('B', '3'), ('C', '4')]
+    assert list(merge(old, new)) == [('A', '1'), ('B', '3'), ('C', '4')]
+    assert list(merge(old, new, keep_removed=False)) == [('B', '3'), ('C', '4')]
+
+
+def test_write_merged(tmpdir):
+    path = str(tmpdir.join('.env'))
+    write_merged(path, [('A', '1'), ('B', '2')], iter([('B', '3')]))
+    assert tmpdir.join('.env').read() == 'A="1"\nB="3"\n'
+    assert dotenv_cache.raw(path) == {'A': '1', 'B': '3'}
+
+
+def test_cli_text(tmpdir):
+    tmpdir.join('old.env').write('A=1\nB=2\nD=5\n')
+    tmpdir.join('new.env').write('B=3\nC=4\nD=5\n')
+    runner = CliRunner()
+    result = runner.invoke(knobs_diff.main, [str(tmpdir.join('old.env')), str(tmpdir.join('new.env'))])
+    assert result.exit_code == 1
+    assert result.output == '- A=1\n~ B=2 -> 3\n+ C=4\n'
+
+    result = runner.invoke(knobs_diff.main, [str(tmpdir.join('new.env')), str(tmpdir.join('new.env'))])
+    assert result.exit_code == 0
+    assert result.output == ''
+
+
+def test_cli_merge_in_place(tmpdir):
+    old = tmpdir.join('old.env')
+    old.write('A=1\nB=2\n')
+    tmpdir.join('new.env').write('B=3\nC=4\n')
+    result = CliRunner().invoke(knobs_diff.main, [str(old), str(tmpdir.join('new.env')), '--merge', str(old)])
+    # the differences are those before the merge
+    assert result.exit_code == 1
+    assert result.output == '- A=1\n~ B=2 -> 3\n+ C=4\n'
+    assert dotenv_cache.raw(str(old)) == {'A': '1', 'B': '3', 'C': '4'}
+
+
+def test_cli_merge_escapes_and_creates(tmpdir):
+    old = tmpdir.join('old.env')
+    old.write('A="C:\\\\new\\\\path"\nB=\'say "yo"\'\n')
+    tmpdir.join('new.env').write('C=3\n')
+    merged = tmpdir.join('merged.env')
+    result = CliRunner().invoke(knobs_diff.main, [str(old), str(tmpdir.join('new.env')), '--merge', str(merged)])
+    assert result.exit_code == 1
+    # values are decoded when read and escaped again when written
+    assert dotenv_cache.raw(str(merged)) == {'A': 'C:\\new\\path', 'B': 'say "yo"', 'C': '3'}
+    # a new file, created as open() would
+    umask = os.umask(0o022)
+    os.umask(umask)
+    assert oct(merged.stat().mode & 0o777) == oct(0o666 & ~umask)
+
+
+def test_cli_defaults_jsonl_and_merge(tmpdir):
+    Knob('DIFF_FLAGS', 1)
+    tmpdir.join('.env').write('DIFF_FLAGS=4\nDIFF_ZZ_EXTRA=x\n')
+    merged = str(tmpdir.join('merged.env'))
+    result = CliRunner().invoke(
+        knobs_diff.main,
+        [':defaults', str(tmpdir.join('.env')), '--format', 'jsonl', '--merge', merged],
+    )
+    assert result.exit_code == 1
+    rows = {row['key']: row for row in map(json.loads, result.output.splitlines())}
+    assert rows['DIFF_FLAGS'] == {'status': CHANGED, 'key': 'DIFF_FLAGS', 'old': '1', 'new': '4'}
+    assert rows['DIFF_ZZ_EXTRA']['status'] == ADDED
+    merged_values = dotenv_cache.raw(merged)
+    assert merged_values['DIFF_FLAGS'] == '4'
+    assert merged_values['DIFF_ZZ_EXTRA'] == 'x'
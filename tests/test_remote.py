@@ -0,0 +1,204 @@
+import os
+
+import pytest
+
+import knobs
+import remote
+from knobs import Knob
+from remote import HttpBackend, LocalConfigServer, RedisBackend, RemoteError, RemoteSource
+from sources import DotenvSource, SourceChain
+
+
+@pytest.fixture
+def server(monkeypatch):
+    for name in ('REMOTE_PIRATES', 'REMOTE_PARROTS', 'REMOTE_LATE', 'REMOTE_SHIPS', 'REMOTE_RUM'):
+        monkeypatch.delenv(name, raising=False)
+    with LocalConfigServer({'REMOTE_PIRATES': '124', 'REMOTE_PARROTS': 2, 'REMOTE_LATE': '7'}) as server:
+        yield server
+    knobs.use_sources(None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(remote, '_clock', lambda: now[0])
+    return now
+
+
+def test_http_backend(server):
+    backend = HttpBackend(server.url)
+    assert backend.fetch(['REMOTE_PIRATES', 'REMOTE_PARROTS', 'REMOTE_RUM']) == {
+        'REMOTE_PIRATES': '124',
+        'REMOTE_PARROTS': '2',
+    }
+    backend.fetch(['REMOTE_PIRATES'])
+    # both requests went over one pooled connection
+    assert len({address for address, _ in server.requests}) == 1
+    backend.close()
+
+
+def test_http_backend_errors():
+    with pytest.raises(ValueError):
+        HttpBackend('ftp://config/knobs')
+    with LocalConfigServer() as server:
+        url = server.url.replace('/knobs', '/missing')
+        with pytest.raises(RemoteError):
+            HttpBackend(url).fetch(['REMOTE_PIRATES'])
+    with pytest.raises(OSError):
+        HttpBackend(url, timeout=1).fetch(['REMOTE_PIRATES'])
+
+
+def test_batched_fetch_of_registered_knobs(server):
+    pirates = Knob('REMOTE_PIRATES', 0)
+    parrots = Knob('REMOTE_PARROTS', 0)
+    knobs.use_sources(RemoteSource(HttpBackend(server.url)))
+    assert pirates.get() == 124
+    assert parrots.get() == 2
+    assert len(server.requests) == 1
+    assert {'REMOTE_PIRATES', 'REMOTE_PARROTS'} <= set(server.requests[0][1])
+
+
+def test_batches_fetched_in_parallel(server):
+    source = RemoteSource(HttpBackend(server.url), batch_size=2)
+    source.values()
+    names = sorted(name for name, _ in Knob.iter_knobs())
+    assert len(server.requests) == (len(names) + 1) // 2
+    assert sorted(name for _, batch in server.requests for name in batch) == names
+
+
+def test_late_names_fetched_once(server):
+    source = RemoteSource(HttpBackend(server.url))
+    source.values()
+    requests = len(server.requests)
+    assert source.get('REMOTE_UNKNOWN') is None
+    assert source.get('REMOTE_UNKNOWN') is None
+    assert len(server.requests) == requests + 1
+
+
+def test_ttl_and_stale_while_revalidate(server, clock):
+    pirates = Knob('REMOTE_PIRATES', 0)
+    changes = []
+    pirates.on_change(changes.append)
+    source = knobs.use_sources(RemoteSource(HttpBackend(server.url), ttl=10, stale=60))
+    assert pirates.get() == 124
+
+    server.values['REMOTE_PIRATES'] = '125'
+    clock[0] += 5
+    assert pirates.get() == 124
+    assert len(server.requests) == 1
+
+    # stale, served while fetched again in the background
+    clock[0] += 10
+    assert source.get('REMOTE_PIRATES') == '124'
+    source.wait()
+    assert changes == [pirates]
+    assert pirates.get() == 125
+    assert len(server.requests) == 2
+
+    # expired, fetched before answering
+    server.values['REMOTE_PIRATES'] = '126'
+    clock[0] += 100
+    assert source.get('REMOTE_PIRATES') == '126'
+
+
+def test_failed_revalidation_serves_stale(server, clock):
+    source = RemoteSource(HttpBackend(server.url), ttl=10, stale=60)
+    assert source.get('REMOTE_PIRATES') == '124'
+    source.backend = HttpBackend(server.url.replace('/knobs', '/missing'))
+    clock[0] += 20
+    with pytest.warns(UserWarning):
+        assert source.get('REMOTE_PIRATES') == '124'
+        source.wait()
+    assert source.get('REMOTE_PIRATES') == '124'
+
+
+class FlakyBackend:
+
+    def __init__(self, values):
+        self.values = values
+        self.down = True
+        self.calls = 0
+
+    def fetch(self, names):
+        self.calls += 1
+        if self.down:
+            raise ConnectionRefusedError('connection refused')
+        return {name: self.values[name] for name in names if name in self.values}
+
+
+def test_unreachable_backend_falls_through(tmpdir, clock, monkeypatch):
+    monkeypatch.delenv('REMOTE_HOST', raising=False)
+    tmpdir.join('.env').write('REMOTE_HOST=localhost\n')
+    backend = FlakyBackend({'REMOTE_HOST': 'db.example.com'})
+    source = RemoteSource(backend, ttl=10, stale=60)
+    knobs.use_sources(SourceChain([source, DotenvSource(str(tmpdir.join('.env')))]))
+    try:
+        host = Knob('REMOTE_HOST', '')
+        with pytest.warns(UserWarning):
+            assert host.get() == 'localhost'
+        # backs off for a ttl
+        assert host.get() == 'localhost'
+        assert backend.calls == 1
+
+        backend.down = False
+        clock[0] += 11
+        assert host.get() == 'db.example.com'
+        assert backend.calls == 2
+
+        # past the stale window, a failed fetch serves the values held
+        backend.down = True
+        clock[0] += 100
+        with pytest.warns(UserWarning):
+            assert host.get() == 'db.example.com'
+        assert host.get() == 'db.example.com'
+        assert backend.calls == 3
+    finally:
+        knobs.use_sources(None)
+
+
+def test_in_source_chain(server, tmpdir):
+    tmpdir.join('.env').write('REMOTE_PIRATES=1\nREMOTE_SHIPS=3\nREMOTE_LATE=1\n')
+    source = RemoteSource(HttpBackend(server.url))
+    knobs.use_sources(SourceChain([source, DotenvSource(str(tmpdir.join('.env')))]))
+    assert Knob('REMOTE_PIRATES', 0).get() == 124
+    assert Knob('REMOTE_SHIPS', 0).get() == 3
+    # registered after the index was built, the remote source still outranks the .env
+    late = Knob('REMOTE_LATE', 0)
+    assert late.get() == 7
+    assert knobs._sources.source_of('REMOTE_LATE') is source
+    # a default is not pinned in the environment, the remote may hold the name later
+    rum = Knob('REMOTE_RUM', 'none')
+    assert rum.get() == 'none'
+    assert 'REMOTE_RUM' not in os.environ
+    server.values['REMOTE_RUM'] = 'dark'
+    source.reload()
+    assert rum.get() == 'dark'
+
+    changes = []
+    late.on_change(changes.append)
+    server.values['REMOTE_LATE'] = '8'
+    source.reload()
+    assert source.get('REMOTE_PIRATES') == '124'
+    assert changes == [late]
+    assert late.get() == 8
+
+
+class FakeRedis:
+
+    def __init__(self, values):
+        self.values = values
+        self.calls = 0
+
+    def mget(self, keys):
+        self.calls += 1
+        return [self.values.get(key) for key in keys]
+
+
+def test_redis_backend():
+    client = FakeRedis({'app:REMOTE_PIRATES': b'124', 'app:REMOTE_PARROTS': b'2'})
+    backend = RedisBackend(client, prefix='app:')
+    assert backend.fetch(['REMOTE_PIRATES', 'REMOTE_PARROTS', 'REMOTE_RUM']) == {
+        'REMOTE_PIRATES': '124',
+        'REMOTE_PARROTS': '2',
+    }
+    assert client.calls == 1
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+import knobs
+from knobs import Knob, ListKnob
+from sources import DotenvSource, JsonSource, SecretsSource, SourceChain, TomlSource
+
+
+@pytest.fixture
+def chain(tmpdir, monkeypatch):
+    for name in ('LAYER_PIRATES', 'LAYER_PARROTS', 'LAYER_SHIPS', 'LAYER_FLAG', 'LAYER_RUM', 'LAYER_PASSWORD'):
+        monkeypatch.delenv(name, raising=False)
+    tmpdir.join('.env.local').write('LAYER_PIRATES=125\n')
+    tmpdir.join('.env').write('LAYER_PIRATES=124\nLAYER_PARROTS=2\n')
+    tmpdir.join('config.json').write(json.dumps({'LAYER_PARROTS': 3, 'LAYER_SHIPS': ['Revenge'], 'LAYER_FLAG': True}))
+    secrets = tmpdir.mkdir('secrets')
+    secrets.join('LAYER_PASSWORD').write('yo ho\n')
+    chain = SourceChain([
+        DotenvSource(str(tmpdir.join('.env.local'))),
+        DotenvSource(str(tmpdir.join('.env'))),
+        JsonSource(str(tmpdir.join('config.json'))),
+        SecretsSource(str(secrets)),
+        DotenvSource(str(tmpdir.join('missing.env'))),
+    ])
+    knobs.use_sources(chain)
+    yield chain
+    knobs.use_sources(None)
+
+
+def test_precedence(chain):
+    assert Knob('LAYER_PIRATES', 0).get() == 125
+    assert Knob('LAYER_PARROTS', 0).get() == 2
+    assert ListKnob('LAYER_SHIPS', []).get() == ['Revenge']
+    assert Knob('LAYER_FLAG', False).get() is True
+    assert Knob('LAYER_PASSWORD', '').get() == 'yo ho'
+    assert Knob('LAYER_RUM', 'none').get() == 'none'
+    # defaults are not written back, a source may hold the name later
+    assert 'LAYER_RUM' not in os.environ
+    assert ListKnob('LAYER_RUM', ['none']).get() == ['none']
+    assert 'LAYER_RUM' not in os.environ
+    assert chain.source_of('LAYER_PARROTS') is chain.sources[1]
+    assert 'LAYER_PASSWORD' not in os.environ
+
+    # the environment wins
+    os.environ['LAYER_PIRATES'] = '126'
+    assert Knob('LAYER_PIRATES', 0).get() == 126
+    del os.environ['LAYER_PIRATES']
+
+
+def test_lazy_secrets(chain, tmpdir):
+    secrets = chain.sources[3]
+    assert secrets.keys() == {'LAYER_PASSWORD'}
+    assert secrets.values() == {'LAYER_PASSWORD': None}
+    assert chain.get('LAYER_PASSWORD') == 'yo ho'
+
+
+def test_reload(chain, tmpdir):
+    pirates = Knob('LAYER_PIRATES', 0, cache=True)
+    parrots = Knob('LAYER_PARROTS', 0)
+    changed = []
+    Knob.on_any_change(changed.append)
+    try:
+        assert pirates.get() == 125
+        assert Knob.snapshot().LAYER_PIRATES == 125
+
+        tmpdir.join('.env.local').write('LAYER_PARROTS=5\n')
+        assert chain.reload(chain.sources[0]) == ['LAYER_PARROTS', 'LAYER_PIRATES']
+        assert changed == [parrots, pirates]
+        assert pirates.get() == 124
+        assert parrots.get() == 5
+        assert Knob.snapshot().LAYER_PIRATES == 124
+
+        # nothing changed
+        assert chain.reload() == []
+    finally:
+        Knob._registry_listeners.remove(changed.append)
+
+
+def test_toml_section(tmpdir):
+    pytest.importorskip('tomllib')
+    path = tmpdir.join('pyproject.toml')
+    path.write('[tool.pirates]\nLAYER_PIRATES = 124\nLAYER_SHIPS = ["Revenge"]\n')
+    source = TomlSource(str(path), section='tool.pirates')
+    assert source.values() == {'LAYER_PIRATES': '124', 'LAYER_SHIPS': '["Revenge"]'}
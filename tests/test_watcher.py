@@ -0,0 +1,99 @@
+import os
+import threading
+
+import pytest
+
+from knobs import Knob
+from watcher import DotenvWatcher
+
+
+@pytest.fixture
+def dotenv(tmpdir, monkeypatch):
+    for name in ('WATCHED_PIRATES', 'WATCHED_PARROTS', 'WATCHED_SHIPS'):
+        monkeypatch.delenv(name, raising=False)
+    dotenv = tmpdir.join('.env')
+    dotenv.write('WATCHED_PIRATES=124\nWATCHED_PARROTS=2\n')
+    return dotenv
+
+
+def test_reload_applies_changed_keys(dotenv, monkeypatch):
+    pirates = Knob('WATCHED_PIRATES', 0, cache=True)
+    parrots = Knob('WATCHED_PARROTS', 0)
+    changes = []
+    pirates.on_change(changes.append)
+    parrots.on_change(changes.append)
+
+    watcher = DotenvWatcher(str(dotenv))
+    watcher.start()
+    watcher.stop()
+    assert pirates.get() == 124
+    assert watcher.check() == []
+
+    dotenv.write('WATCHED_PIRATES=125\nWATCHED_SHIPS=3\n')
+    assert sorted(watcher.check()) == ['WATCHED_PARROTS', 'WATCHED_PIRATES', 'WATCHED_SHIPS']
+    assert pirates.get() == 125
+    assert 'WATCHED_PARROTS' not in os.environ
+    assert os.environ['WATCHED_SHIPS'] == '3'
+    assert changes == [pirates, parrots]
+
+
+def test_reload_keeps_environment_overrides(dotenv, monkeypatch):
+    monkeypatch.setenv('WATCHED_PIRATES', '1')
+    watcher = DotenvWatcher(str(dotenv))
+    watcher.start()
+    watcher.stop()
+
+    dotenv.write('WATCHED_PIRATES=125\nWATCHED_PARROTS=3\n')
+    assert watcher.check() == ['WATCHED_PARROTS']
+    assert os.environ['WATCHED_PIRATES'] == '1'
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_watcher_thread(dotenv, use_inotify):
+    pirates = Knob('WATCHED_PIRATES', 0)
+    changed = threading.Event()
+    pirates.on_change(lambda knob: changed.set())
+
+    with DotenvWatcher(str(dotenv), interval=0.01, use_inotify=use_inotify):
+        dotenv.write('WATCHED_PIRATES=125\n')
+        assert changed.wait(5)
+    assert pirates.get() == 125
+
+
+def test_reload_replaces_written_defaults(dotenv):
+    watcher = DotenvWatcher(str(dotenv))
+    watcher.start()
+    watcher.stop()
+    ships = Knob('WATCHED_SHIPS', 0)
+    # get() writes the default to the environment
+    assert ships.get() == 0
+    assert os.environ['WATCHED_SHIPS'] == '0'
+
+    dotenv.write('WATCHED_PIRATES=124\nWATCHED_PARROTS=2\nWATCHED_SHIPS=3\n')
+    assert watcher.check() == ['WATCHED_SHIPS']
+    assert ships.get() == 3
+
+    ships.set(4)
+    dotenv.write('WATCHED_PIRATES=124\nWATCHED_PARROTS=2\nWATCHED_SHIPS=5\n')
+    assert watcher.check() == []
+    assert ships.get() == 4
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_watcher_symlink_swap(tmpdir, monkeypatch, use_inotify):
+    # the layout of a Kubernetes ConfigMap volume, .env -> ..data/.env and ..data -> a versioned directory
+    monkeypatch.delenv('WATCHED_PIRATES', raising=False)
+    tmpdir.mkdir('v1').join('.env').write('WATCHED_PIRATES=124\n')
+    tmpdir.mkdir('v2').join('.env').write('WATCHED_PIRATES=125\n')
+    os.symlink('v1', str(tmpdir.join('..data')))
+    os.symlink(os.path.join('..data', '.env'), str(tmpdir.join('.env')))
+    pirates = Knob('WATCHED_PIRATES', 0)
+    changed = threading.Event()
+    pirates.on_change(lambda knob: changed.set())
+
+    with DotenvWatcher(str(tmpdir.join('.env')), interval=0.01, use_inotify=use_inotify):
+        assert pirates.get() == 124
+        os.symlink('v2', str(tmpdir.join('..data_tmp')))
+        os.rename(str(tmpdir.join('..data_tmp')), str(tmpdir.join('..data')))
+        assert changed.wait(5)
+    assert pirates.get() == 125